@@ -0,0 +1,77 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.aio
+    ~~~~~~~~~~~~
+
+    The aio module renders images without blocking an :mod:`asyncio`
+    event loop.
+
+    Decoding and resizing happen in an executor, and so does quantizing,
+    a batch of rows at a time.  Lines are handed back as each batch is
+    ready, so other coroutines get to run in between::
+
+        img = await image.Image.open_async("balls.png")
+        async for line in img.aiter():
+            await ws.send(line)
+        text = await img.render_async()
+
+    You normally reach me through those methods of
+    :class:`fabulous.image.Image`.  I need Python 3.7 or newer, which is
+    why I live in my own module.
+
+"""
+
+import asyncio
+import itertools
+
+
+# rows of cells quantized per trip to the executor
+BATCH = 32
+
+
+async def open_image(cls, path, width=None, executor=None):
+    """Constructs ``cls(path, width)`` in ``executor``
+
+    :param executor: A :class:`concurrent.futures.Executor`, or None
+                     for the event loop's default one.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, cls, path, width)
+
+
+async def lines(img, executor=None, batch=BATCH):
+    """Yields the lines of ``img``, converting ``batch`` at a time
+
+    The lines are the same ones iterating over ``img`` gives you.
+    """
+    loop = asyncio.get_running_loop()
+    rows = iter(img)
+    while True:
+        chunk = await loop.run_in_executor(
+            executor, _take, rows, batch)
+        if not chunk:
+            return
+        for line in chunk:
+            yield line
+
+
+async def render(img, executor=None, batch=BATCH):
+    """Returns the same string as ``str(img)``"""
+    return "\n".join([line async for line in lines(img, executor, batch)])
+
+
+def _take(rows, count):
+    return list(itertools.islice(rows, count))
@@ -24,6 +24,7 @@
 
 """
 
+import re
 import sys
 import functools
 
@@ -50,6 +51,61 @@ def esc(*codes):
     return "\x1b[%sm" % (";".join([str(c) for c in codes]))
 
 
+if sys.version_info[0] > 2:
+    try:
+        import wcwidth
+    except ImportError:
+        wcwidth = None
+else:
+    wcwidth = None
+
+
+def _text_width(text):
+    """Returns how many cells a string takes up
+
+    We use:
+
+    * wcwidth to find the length of strs, if it's installed
+    * len(str(item)) to find the length of a bytes object
+    * len(item) for everything else.
+    """
+    if isinstance(text, bytes) and bytes is not str:
+        return len(str(text))
+    if wcwidth is None or not isinstance(text, unicode):
+        return len(text)
+    if _printable_ascii(text):
+        return len(text)
+    if u'\u200d' in text or u'\ufe0f' in text:
+        # joiners and emoji presentation depend on the characters nearby
+        return wcwidth.wcswidth(text)
+    total = 0
+    for char in text:
+        width = _char_width(char)
+        if width < 0:
+            return width
+        total += width
+    return total
+
+
+if hasattr(str, 'isascii'):
+    def _printable_ascii(text):
+        return text.isascii() and text.isprintable()
+else:
+    _not_printable_ascii = re.compile(u'[^\x20-\x7e]').search
+
+    def _printable_ascii(text):
+        return _not_printable_ascii(text) is None
+
+if wcwidth is not None:
+    _char_width = functools.lru_cache(maxsize=4096)(wcwidth.wcwidth)
+
+
+# what turns each attribute off, in the order escape codes are written
+RESETS = (('bold', '22'), ('italic', '23'), ('underline', '24'),
+          ('blink', '25'), ('flip', '27'), ('strike', '29'),
+          ('fg', '39'), ('bg', '49'))
+
+
 class ColorString(object):
     r"""Abstract base class for stylized string-like objects.
 
@@ -58,10 +114,17 @@ class ColorString(object):
         >>> str(red("hello"))
         '\x1b[31mhello\x1b[39m'
         >>> str(bold(red("hello")))
-        '\x1b[1m\x1b[31mhello\x1b[39m\x1b[22m'
+        '\x1b[1;31mhello\x1b[22;39m'
         >>> str(plain("hello ", bold("world")))
         'hello \x1b[1mworld\x1b[22m'
 
+    Nested styles are flattened before they're printed (see
+    :meth:`spans`), so only the escape codes that change something are
+    written, and an inner style ending puts the outer one back::
+
+        >>> str(red("a", blue("b"), "c"))
+        '\x1b[31ma\x1b[34mb\x1b[31mc\x1b[39m'
+
     These objects also provide string length without taking into consideration
     the ANSI escape codes::
 
@@ -74,38 +137,117 @@ class ColorString(object):
         >>> len(bold("hello ", red("world")))
         11
 
-    If you have the wcwidth module installed, it will be used for computing lengths::
-
+    If you have the wcwidth module installed, it will be used for computing
+    lengths, so wide characters count as two::
 
+        >>> len(red(u"\u4f60\u597d")) == (4 if wcwidth else 2)
+        True
 
     """
     sep = ""
     fmt = "%s"
+    # ((attribute, SGR parameters), ...) see RESETS for the attributes
+    style = ()
+    # (items, width) from the last time my length was computed
+    _width = None
 
     def __init__(self, *items):
         self.items = items
 
     def __str__(self):
-        return self.fmt % (self.sep.join([unicode(s) for s in self.items]))
+        if not _flattens(type(self)):
+            return self._format(self.sep.join([unicode(s) for s in self.items]))
+        return render(self.spans())
+
+    def spans(self):
+        r"""Flattens me into a list of ``(style, text)`` spans
+
+        ``style`` is a dict of the SGR parameters in effect for
+        ``text``, by attribute.  The tree is walked once, without
+        recursion, and spans with the same style share the same dict::
+
+            >>> bold("a", red("b")).spans()
+            [({'bold': '1'}, 'a'), ({'bold': '1', 'fg': '31'}, 'b')]
+
+        Subclasses that only override :attr:`fmt` or ``__str__`` can't be
+        taken apart, so their text (escape codes and all) is one span.
+        """
+        if not _flattens(type(self)):
+            return [({}, _Escaped(self))]
+        spans = []
+        stack = [(iter(self._children()), dict(self._style()))]
+        while stack:
+            (children, style) = stack[-1]
+            for child in children:
+                if isinstance(child, ColorString):
+                    if _flattens(type(child)):
+                        inner = style
+                        if child._style():
+                            inner = dict(style)
+                            inner.update(child._style())
+                        stack.append((iter(child._children()), inner))
+                        break
+                    child = _Escaped(child)
+                else:
+                    child = unicode(child)
+                if child:
+                    spans.append((style, child))
+            else:
+                stack.pop()
+        return spans
+
+    def _children(self):
+        if not self.sep or len(self.items) < 2:
+            return self.items
+        children = [self.items[0]]
+        for item in self.items[1:]:
+            children.append(self.sep)
+            children.append(item)
+        return children
+
+    def _style(self):
+        """Returns ``((attribute, SGR parameters), ...)`` for me"""
+        return self.style
+
+    def _format(self, text):
+        """Wraps ``text`` in :attr:`fmt`"""
+        return self.fmt % (text)
 
     def __repr__(self):
         return repr(unicode(self))
 
 
-    if sys.version_info[0] > 2:
-        def __len__(self):
-            try:
-                import wcwidth
-                # We use:
-                # * wcwidth.wcswidth(item) to find the length of strs
-                # * len(str(item)) to find the length of a bytes object
-                # * len(item) for everything else.
-                return sum([ wcwidth.wcswidth(item) if isinstance(item, str) else len(str(item)) if isinstance(item, bytes) else len(item) for item in self.items ])
-            except ModuleNotFoundError:
-                return sum([len(str(item)) if isinstance(item, bytes) else len(item) for item in self.items])
-    else:
-        def __len__(self):
-            return sum([len(item) for item in self.items])
+    def __len__(self):
+        """Returns how many cells I take up, without the escape codes
+
+        The answer is remembered until :attr:`items` is replaced, so
+        please don't change the ColorStrings inside me once I've been
+        measured.  The tree is walked without recursion.
+        """
+        width = self._width
+        if width is not None and width[0] is self.items:
+            return width[1]
+        stack = [[self, iter(self.items), 0]]
+        while True:
+            frame = stack[-1]
+            for item in frame[1]:
+                if not isinstance(item, ColorString):
+                    frame[2] += _text_width(item)
+                    continue
+                width = item._width
+                if width is not None and width[0] is item.items:
+                    frame[2] += width[1]
+                elif type(item).__len__ is not ColorString.__len__:
+                    frame[2] += len(item)
+                else:
+                    stack.append([item, iter(item.items), 0])
+                    break
+            else:
+                (node, _, width) = stack.pop()
+                node._width = (node.items, width)
+                if not stack:
+                    return width
+                stack[-1][2] += width
 
     def __add__(self, cs):
         if not isinstance(cs, (basestring, ColorString)):
@@ -124,8 +266,9 @@ class ColorString(object):
         """A more readable way to say ``unicode(color).encode('utf8')``
         """
         return unicode(self).encode('utf8')
+
     def join(self, iterable):
-        """
+        r"""
         This works just like `str.join()`, but for ColorStrings!
 
         For example:
@@ -135,17 +278,59 @@ class ColorString(object):
             ...     fg256("green", "napster good"),
             ...     fg256("red", "fire bad"),
             ... ]
-            >>> print(plain(" ").join(l))
-
+            >>> str(plain(" ").join(l))
+            '\x1b[38;5;28mnapster good\x1b[39m \x1b[38;5;196mfire bad\x1b[39m'
+
+        The result is one flat :class:`ColorString`, however many items
+        there are, so joining thousands of them takes linear time and
+        printing them doesn't hit the recursion limit.  Like before,
+        joining nothing returns None, and joining one thing returns it
+        as is.  Concatenating with ``+`` just nests, so it stays cheap
+        in a loop; it's flattened when it's printed or joined.
         """
-        ret = None
+        parts = []
         for x in iterable:
-            if ret is None:
-                ret = x
-            else:
-                ret += self
-                ret += x
-        return ret
+            if parts:
+                parts.append(self)
+            parts.append(x)
+        if len(parts) < 2:
+            return parts[0] if parts else None
+        for x in parts:
+            if not isinstance(x, (basestring, ColorString)):
+                msg = "Concatenatation failed: %r (Not a ColorString or str)"
+                raise TypeError(msg % (type(x),))
+        return _concat(parts)
+
+
+def _concat(parts):
+    """Concatenates strings and ColorStrings into a flat ColorString
+
+    Instead of nesting, the items of unstyled ColorStrings (the ones
+    ``+`` made, and :class:`plain`) are spliced in, and neighboring
+    strings are merged::
+
+        >>> rope = _concat([plain("a") + "b", red("c"), "d"])
+        >>> [type(item).__name__ for item in rope.items]
+        ['str', 'red', 'str']
+        >>> rope.items[0]
+        'ab'
+
+    """
+    items = []
+    stack = [iter(parts)]
+    while stack:
+        for part in stack[-1]:
+            if type(part) in _ROPES and not part.sep:
+                stack.append(iter(part.items))
+                break
+            if (items and isinstance(part, unicode)
+                    and type(items[-1]) is type(part)):
+                items[-1] += part
+            elif isinstance(part, ColorString) or part:
+                items.append(part)
+        else:
+            stack.pop()
+    return ColorString(*items)
 
 
 class ColorString256(ColorString):
@@ -160,9 +345,12 @@ class ColorString256(ColorString):
         self.color = xterm256.rgb_to_xterm(r, g, b)
         self.items = items
 
-    def __str__(self):
-        return self.fmt % (
-            self.color, self.sep.join([unicode(s) for s in self.items]))
+    def _style(self):
+        return tuple([(attr, params % self.color if '%' in params else params)
+                      for (attr, params) in self.style])
+
+    def _format(self, text):
+        return self.fmt % (self.color, text)
 
 class ColorStringTrue(ColorString):
     r"""Base class for 24-bit "truecolor" stylized string-like objects.
@@ -175,9 +363,12 @@ class ColorStringTrue(ColorString):
         self.color = parse_color(color)
         self.items = items
 
-    def __str__(self):
-        return self.fmt % (
-            self.color[0], self.color[1], self.color[2], self.sep.join([unicode(s) for s in self.items]))
+    def _style(self):
+        return tuple([(attr, params % self.color if '%' in params else params)
+                      for (attr, params) in self.style])
+
+    def _format(self, text):
+        return self.fmt % (self.color + (text,))
 
 class plain(ColorString):
     r"""Plain text wrapper
@@ -213,6 +404,7 @@ class bold(ColorString):
 
     """
     fmt = esc(1) + "%s" + esc(22)
+    style = (('bold', '1'),)
 
 
 class italic(ColorString):
@@ -228,6 +420,7 @@ class italic(ColorString):
 
     """
     fmt = esc(3) + "%s" + esc(23)
+    style = (('italic', '3'),)
 
 
 class underline(ColorString):
@@ -249,6 +442,7 @@ class underline(ColorString):
 
     """
     fmt = esc(4) + "%s" + esc(24)
+    style = (('underline', '4'),)
 
 
 class underline2(ColorString):
@@ -263,6 +457,7 @@ class underline2(ColorString):
 
     """
     fmt = esc(21) + "%s" + esc(24)
+    style = (('underline', '21'),)
 
 
 class strike(ColorString):
@@ -284,6 +479,7 @@ class strike(ColorString):
 
     """
     fmt = esc(9) + "%s" + esc(29)
+    style = (('strike', '9'),)
 
 
 class blink(ColorString):
@@ -305,6 +501,7 @@ class blink(ColorString):
 
     """
     fmt = esc(5) + "%s" + esc(25)
+    style = (('blink', '5'),)
 
 
 class flip(ColorString):
@@ -327,6 +524,7 @@ class flip(ColorString):
 
     """
     fmt = esc(7) + "%s" + esc(27)
+    style = (('flip', '7'),)
 
 
 class black(ColorString):
@@ -353,6 +551,7 @@ class black(ColorString):
 
     """
     fmt = esc(30) + "%s" + esc(39)
+    style = (('fg', '30'),)
 
 class red(ColorString):
     r"""Red foreground text wrapper
@@ -378,6 +577,7 @@ class red(ColorString):
 
     """
     fmt = esc(31) + "%s" + esc(39)
+    style = (('fg', '31'),)
 
 
 class green(ColorString):
@@ -404,6 +604,7 @@ class green(ColorString):
 
     """
     fmt = esc(32) + "%s" + esc(39)
+    style = (('fg', '32'),)
 
 
 class yellow(ColorString):
@@ -431,6 +632,7 @@ class yellow(ColorString):
 
     """
     fmt = esc(33) + "%s" + esc(39)
+    style = (('fg', '33'),)
 
 
 class blue(ColorString):
@@ -457,6 +659,7 @@ class blue(ColorString):
 
     """
     fmt = esc(34) + "%s" + esc(39)
+    style = (('fg', '34'),)
 
 
 class magenta(ColorString):
@@ -483,6 +686,7 @@ class magenta(ColorString):
 
     """
     fmt = esc(35) + "%s" + esc(39)
+    style = (('fg', '35'),)
 
 
 class cyan(ColorString):
@@ -509,6 +713,7 @@ class cyan(ColorString):
 
     """
     fmt = esc(36) + "%s" + esc(39)
+    style = (('fg', '36'),)
 
 
 class white(ColorString):
@@ -535,6 +740,7 @@ class white(ColorString):
 
     """
     fmt = esc(37) + "%s" + esc(39)
+    style = (('fg', '37'),)
 
 
 class highlight_black(ColorString):
@@ -545,6 +751,7 @@ class highlight_black(ColorString):
 
     """
     fmt = esc(1, 30, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '30'))
 
 
 class highlight_red(ColorString):
@@ -555,6 +762,7 @@ class highlight_red(ColorString):
 
     """
     fmt = esc(1, 31, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '31'))
 
 
 class highlight_green(ColorString):
@@ -565,6 +773,7 @@ class highlight_green(ColorString):
 
     """
     fmt = esc(1, 32, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '32'))
 
 
 class highlight_yellow(ColorString):
@@ -575,6 +784,7 @@ class highlight_yellow(ColorString):
 
     """
     fmt = esc(1, 33, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '33'))
 
 
 class highlight_blue(ColorString):
@@ -585,6 +795,7 @@ class highlight_blue(ColorString):
 
     """
     fmt = esc(1, 34, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '34'))
 
 
 class highlight_magenta(ColorString):
@@ -595,6 +806,7 @@ class highlight_magenta(ColorString):
 
     """
     fmt = esc(1, 35, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '35'))
 
 
 class highlight_cyan(ColorString):
@@ -605,6 +817,7 @@ class highlight_cyan(ColorString):
 
     """
     fmt = esc(1, 36, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '36'))
 
 
 class highlight_white(ColorString):
@@ -615,6 +828,7 @@ class highlight_white(ColorString):
 
     """
     fmt = esc(1, 37, 7) + "%s" + esc(22, 27, 39)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '37'))
 
 
 class black_bg(ColorString):
@@ -636,6 +850,7 @@ class black_bg(ColorString):
 
     """
     fmt = esc(40) + "%s" + esc(49)
+    style = (('bg', '40'),)
 
 
 class red_bg(ColorString):
@@ -657,6 +872,7 @@ class red_bg(ColorString):
 
     """
     fmt = esc(41) + "%s" + esc(49)
+    style = (('bg', '41'),)
 
 
 class green_bg(ColorString):
@@ -678,6 +894,7 @@ class green_bg(ColorString):
 
     """
     fmt = esc(42) + "%s" + esc(49)
+    style = (('bg', '42'),)
 
 
 class yellow_bg(ColorString):
@@ -699,6 +916,7 @@ class yellow_bg(ColorString):
 
     """
     fmt = esc(43) + "%s" + esc(49)
+    style = (('bg', '43'),)
 
 
 class blue_bg(ColorString):
@@ -720,6 +938,7 @@ class blue_bg(ColorString):
 
     """
     fmt = esc(44) + "%s" + esc(49)
+    style = (('bg', '44'),)
 
 
 class magenta_bg(ColorString):
@@ -741,6 +960,7 @@ class magenta_bg(ColorString):
 
     """
     fmt = esc(45) + "%s" + esc(49)
+    style = (('bg', '45'),)
 
 
 class cyan_bg(ColorString):
@@ -762,6 +982,7 @@ class cyan_bg(ColorString):
 
     """
     fmt = esc(46) + "%s" + esc(49)
+    style = (('bg', '46'),)
 
 
 class white_bg(ColorString):
@@ -783,6 +1004,7 @@ class white_bg(ColorString):
 
     """
     fmt = esc(47) + "%s" + esc(49)
+    style = (('bg', '47'),)
 
 
 class fg256(ColorString256):
@@ -814,6 +1036,7 @@ class fg256(ColorString256):
 
     """
     fmt = esc(38, 5, "%d") + "%s" + esc(39)
+    style = (('fg', '38;5;%d'),)
 
 
 class fgtrue(ColorStringTrue):
@@ -840,6 +1063,7 @@ class fgtrue(ColorStringTrue):
 
     """
     fmt = esc(38, 2, "%d", "%d", "%d") + "%s" + esc(39)
+    style = (('fg', '38;2;%d;%d;%d'),)
 
 
 class bg256(ColorString256):
@@ -872,6 +1096,7 @@ class bg256(ColorString256):
 
     """
     fmt = esc(48, 5, "%d") + "%s" + esc(49)
+    style = (('bg', '48;5;%d'),)
 
 
 class bgtrue(ColorStringTrue):
@@ -898,6 +1123,7 @@ class bgtrue(ColorStringTrue):
 
     """
     fmt = esc(48, 2, "%d", "%d", "%d") + "%s" + esc(49)
+    style = (('bg', '48;2;%d;%d;%d'),)
 
 
 class highlight256(ColorString256):
@@ -908,6 +1134,7 @@ class highlight256(ColorString256):
 
     """
     fmt = esc(1, 38, 5, "%d", 7) + "%s" + esc(27, 39, 22)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '38;5;%d'))
 
 
 class highlighttrue(ColorStringTrue):
@@ -918,6 +1145,7 @@ class highlighttrue(ColorStringTrue):
 
     """
     fmt = esc(1, 38, 2, "%d", "%d", "%d", 7) + "%s" + esc(27, 39, 22)
+    style = (('bold', '1'), ('flip', '7'), ('fg', '38;2;%d;%d;%d'))
 
 
 class complement256(ColorString256):
@@ -933,15 +1161,20 @@ class complement256(ColorString256):
     """
     fmt = esc(1, 38, 5, "%d", 48, 5, "%d") + "%s" + esc(49, 39, 22)
 
+    style = (('bold', '1'), ('fg', '38;5;%(fg)d'), ('bg', '48;5;%(bg)d'))
+
     def __init__(self, color, *items):
         self.bg = xterm256.rgb_to_xterm(*parse_color(color))
         self.fg = xterm256.rgb_to_xterm(*complement(color))
         self.items = items
 
-    def __str__(self):
-        return self.fmt % (
-            self.fg, self.bg,
-            self.sep.join([unicode(s) for s in self.items]))
+    def _style(self):
+        colors = {'fg': self.fg, 'bg': self.bg}
+        return tuple([(attr, params % colors)
+                      for (attr, params) in self.style])
+
+    def _format(self, text):
+        return self.fmt % (self.fg, self.bg, text)
 
 
 class complementtrue(ColorStringTrue):
@@ -957,16 +1190,94 @@ class complementtrue(ColorStringTrue):
     """
     fmt = esc(1, 38, 2, "%d", "%d", "%d", 48, 2, "%d", "%d", "%d") + "%s" + esc(49, 39, 22)
 
+    style = (('bold', '1'), ('fg', '38;2;%d;%d;%d'), ('bg', '48;2;%d;%d;%d'))
+
     def __init__(self, color, *items):
         self.bg = parse_color(color)
         self.fg = complement(color)
         self.items = items
 
-    def __str__(self):
-        return self.fmt % (
-            self.fg[0], self.fg[1], self.fg[2],
-            self.bg[0], self.bg[1], self.bg[2],
-            self.sep.join([unicode(s) for s in self.items]))
+    def _style(self):
+        return (('bold', '1'), ('fg', self.style[1][1] % self.fg),
+                ('bg', self.style[2][1] % self.bg))
+
+    def _format(self, text):
+        return self.fmt % (self.fg + self.bg + (text,))
+
+
+# unstyled classes whose items can be spliced into a concatenation
+_ROPES = (ColorString, plain)
+
+
+def render(spans):
+    r"""Turns spans from :meth:`ColorString.spans` into text
+
+    Between spans, I only write the SGR parameters that changed, and
+    everything is turned off at the end::
+
+        >>> render([({'fg': '31'}, 'a'), ({'fg': '31', 'bold': '1'}, 'b'),
+        ...         ({}, 'c')])
+        '\x1b[31ma\x1b[1mb\x1b[22;39mc'
+
+    """
+    out = []
+    current = {}
+    unknown = False
+    for (style, text) in spans:
+        if unknown or style is not current:
+            codes = _transition(current, style, unknown)
+            if codes:
+                out.append(esc(*codes))
+        out.append(text)
+        current = style
+        # escape codes inside the text could have changed anything
+        unknown = isinstance(text, _Escaped)
+    codes = _transition(current, {}, unknown)
+    if codes:
+        out.append(esc(*codes))
+    return "".join(out)
+
+
+def _transition(old, new, unknown=False):
+    """Returns the SGR parameters that turn style ``old`` into ``new``"""
+    codes = []
+    for (attr, reset) in RESETS:
+        if attr in new:
+            if unknown or old.get(attr) != new[attr]:
+                codes.append(new[attr])
+        elif attr in old:
+            codes.append(reset)
+    return codes
+
+
+class _Escaped(unicode):
+    """Text of a :class:`ColorString` that couldn't be flattened"""
+
+    def __new__(cls, cs):
+        return unicode.__new__(cls, unicode(cs))
+
+
+_flat_classes = {}
+
+
+def _flattens(cls):
+    """Returns true if :meth:`ColorString.spans` understands ``cls``
+
+    That's when its escape codes come from :attr:`ColorString.style`,
+    rather than from a ``fmt`` or ``__str__`` of its own.
+    """
+    flat = _flat_classes.get(cls)
+    if flat is None:
+        flat = False
+        for klass in cls.__mro__:
+            attrs = vars(klass)
+            if 'style' in attrs:
+                flat = True
+                break
+            if 'fmt' in attrs or '__str__' in attrs or '_format' in attrs:
+                break
+        _flat_classes[cls] = flat
+    return flat
 
 
 def h1(title, line=OVERLINE):
@@ -25,35 +25,16 @@
 from __future__ import print_function
 
 import sys
-import itertools
 
-from fabulous import image
+from fabulous import image, runs
 
 
 class DebugImage(image.Image):
     """Visualize optimization techniques used by :class:`Image`
     """
 
-    def reduce(self, colors):
-        need_reset = False
-        line = ''
-        for color, items in itertools.groupby(colors):
-            if color is None:
-                if need_reset:
-                    line = line[:-1] + ">"
-                    need_reset = False
-                line += 'T' + (self.pad * len(list(items)))[1:]
-            elif color == "EOL":
-                if need_reset:
-                    line = line[:-1] + ">"
-                    need_reset = False
-                    yield line.rstrip(' T')
-                else:
-                    yield line.rstrip(' T')
-                line = ''
-            else:
-                need_reset = True
-                line += '<' + (self.pad * len(list(items)))[1:]
+    def format_row(self, row):
+        return runs.debug_line(row, self.pad)
 
 
 def main():
@@ -0,0 +1,445 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.fontpack
+    ~~~~~~~~~~~~~~~~~
+
+    The fontpack module stores TrueType fonts pre-rendered at terminal
+    cell resolution, so :class:`fabulous.text.BitmapText` can print
+    banners without loading :mod:`PIL` at all.
+
+    Building packs needs :mod:`PIL`, and only has to happen once::
+
+        jart@compy:~$ fabulous-text --build-packs
+        jart@compy:~$ fabulous-text --bitmap 'Fabulous!'
+
+    A pack holds one font at one size.  For each character it stores
+    how much of every cell the glyph covers, its advance width, and
+    the kerning between each pair of characters.  Coverage is
+    quantized to sixteen levels, which are turned into xterm colors for
+    whatever text and background color you print with.  Packs are
+    memory mapped, so only the glyphs you print are ever read.
+
+    Pack files look like this (little endian)::
+
+        "FPAK\\x01" fsize:u16 rows:u16 glyphs:u32 kerns:u32
+        glyphs * (codepoint:u32 offset:i16 width:u16 advance:i32 data:u32)
+        kerns * (left:u32 right:u32 kern:i32)
+        coverage bytes, rows * width for each glyph
+
+    Advances and kerning are measured in 64ths of a cell.
+
+    Emoji are kept in a :class:`SpriteCache` instead, which only draws
+    the ones that actually get printed.
+
+"""
+
+import io
+import os
+import mmap
+import zlib
+import struct
+import threading
+
+from fabulous import utils, xterm256, grapefruit
+
+
+MAGIC = b'FPAK\x01'
+HEADER = struct.Struct('<HHII')
+GLYPH = struct.Struct('<IhHiI')
+KERN = struct.Struct('<IIi')
+
+SPRITE_MAGIC = b'FSPR\x01'
+SPRITE_HEADER = struct.Struct('<HH')
+
+# sizes built by default, which includes the default size of Text
+SIZES = (12, 16, 23, 32)
+
+# printable ascii
+CHARS = u''.join(chr(n) for n in range(32, 127))
+
+
+class PackError(ValueError):
+    """I get raised when a font pack is missing or corrupt
+
+    This class extends the standard :exc:`ValueError` exception so you
+    don't have to import me if you don't want to.
+    """
+
+
+def pack_dirs():
+    """Returns the directories searched for packs, in order
+
+    Packs bundled with Fabulous come first, then the ones you built.
+    """
+    return [os.path.join(os.path.dirname(__file__), 'fonts', 'packs'),
+            os.path.join(utils.cache_dir(), 'packs')]
+
+
+def pack_name(font, fsize):
+    """Returns the file name of a pack, for a font name or path"""
+    return '%s-%d.fpak' % (os.path.splitext(os.path.basename(font))[0], fsize)
+
+
+def find(font, fsize):
+    """Returns the path of the pack for ``font`` at ``fsize`` points
+
+    :raise PackError: If no such pack has been built.
+    """
+    for directory in pack_dirs():
+        path = os.path.join(directory, pack_name(font, fsize))
+        if os.path.exists(path):
+            return path
+    raise PackError("No %r pack at %d points, try: fabulous-text "
+                    "--build-packs --font=%s --size=%d" % (
+                        font, fsize, font, fsize))
+
+
+class Pack(object):
+    """A memory mapped font pack
+
+    I have the same ``rows``, ``glyph()`` and ``kerning()`` interface as
+    :class:`fabulous.text.GlyphAtlas`, so
+    :func:`fabulous.text.compose` can paste my glyphs together.
+    Characters that aren't in the pack are drawn as ``?``.
+
+    :param color:   Color of the text, as you would in HTML/CSS.
+    :param bgcolor: Color the text is blended into.  Defaults to
+                    :attr:`fabulous.utils.TerminalInfo.bgcolor`.
+    """
+
+    def __init__(self, path, color="#0099ff", bgcolor=None):
+        self.path = path
+        with io.open(path, 'rb') as fp:
+            try:
+                self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                raise PackError("%r is empty" % path)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise PackError("%r is not a font pack" % path)
+        pos = len(MAGIC)
+        (self.fsize, self.rows, count, kerns) = HEADER.unpack_from(
+            self._mm, pos)
+        pos += HEADER.size
+        self._index = {}
+        for _ in range(count):
+            entry = GLYPH.unpack_from(self._mm, pos)
+            self._index[entry[0]] = entry[1:]
+            pos += GLYPH.size
+        self._kerning = {}
+        for _ in range(kerns):
+            (left, right, kern) = KERN.unpack_from(self._mm, pos)
+            self._kerning[(left, right)] = kern / 64.0
+            pos += KERN.size
+        self._data = pos
+        self._glyphs = {}
+        self._palette = _palette(color, bgcolor or utils.term.bgcolor)
+
+    def close(self):
+        self._mm.close()
+
+    def __contains__(self, char):
+        return ord(char) in self._index
+
+    def glyph(self, char):
+        """Returns ``(offset, rows, advance)`` like :class:`GlyphAtlas`"""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            entry = self._index.get(ord(char)) or self._index.get(ord(u'?'))
+            if entry is None:
+                return (0, [], 0.0)
+            (offset, width, advance, start) = entry
+            start += self._data
+            data = self._mm[start:start + width * self.rows]
+            glyph = self._glyphs[char] = (
+                offset, _colorize(data, width, self._palette), advance / 64.0)
+        return glyph
+
+    def kerning(self, left, right):
+        return self._kerning.get((ord(left), ord(right)), 0.0)
+
+
+def build(font='NotoSans-Bold', sizes=SIZES, chars=CHARS, directory=None):
+    """Renders a TrueType font into packs, one per size
+
+    This needs :mod:`PIL`.  Glyphs are drawn and shrunk to cells the
+    same way :class:`fabulous.text.GlyphAtlas` does it.
+
+    :param font:      Font name or path, see
+                      :func:`fabulous.text.resolve_font`.
+    :param directory: Where to save the packs.  Defaults to the last
+                      of :func:`pack_dirs`.
+
+    :return: List of the paths written.
+    """
+    from fabulous import text
+    utils.pil_check()
+    if directory is None:
+        directory = pack_dirs()[-1]
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for fsize in sizes:
+        face = text.get_font(font, fsize)
+        rows = sum(face.getmetrics()) // 2
+        table = []
+        data = bytearray()
+        for char in chars:
+            (offset, width, advance, coverage) = _coverage(face, char)
+            table.append(GLYPH.pack(ord(char), offset, width, advance,
+                                    len(data)))
+            data.extend(coverage)
+        kerns = []
+        for a in chars:
+            for b in chars:
+                kern = face.getlength(a + b) - face.getlength(a) - \
+                    face.getlength(b)
+                kern = int(round(kern * 64))
+                if kern:
+                    kerns.append(KERN.pack(ord(a), ord(b), kern))
+        path = os.path.join(directory, pack_name(font, fsize))
+        tmp = path + '.tmp'
+        with io.open(tmp, 'wb') as fp:
+            fp.write(MAGIC)
+            fp.write(HEADER.pack(fsize, rows, len(table), len(kerns)))
+            fp.write(b''.join(table))
+            fp.write(b''.join(kerns))
+            fp.write(bytes(data))
+        os.rename(tmp, path)
+        paths.append(path)
+    return paths
+
+
+class SpriteCache(object):
+    """Glyphs that are rasterized the first time they're used, ever
+
+    Emoji are too many to build packs of ahead of time, but a status
+    page only uses a handful of them over and over.  I'm like a
+    :class:`Pack` that starts out empty.  Glyphs that aren't in me yet
+    are drawn with :mod:`PIL` and appended to my file in the cache
+    directory, which other processes (and later runs) memory map and
+    read instead of drawing them again.
+
+    Each record in the file is checksummed.  If one turns out to be
+    corrupt, the file is started over, and other processes notice it
+    was replaced and index it again.  Deleting it is always safe.
+
+    File format (little endian)::
+
+        "FSPR\x01" fsize:u16 rows:u16
+        records * (codepoint:u32 offset:i16 width:u16 advance:i32
+                   crc32:u32 coverage:u8[rows * width])
+
+    :param font:      Font name or path, see
+                      :func:`fabulous.text.resolve_font`.
+    :param directory: Where to keep the file.  Defaults to ``sprites``
+                      in :func:`fabulous.utils.cache_dir`.
+    """
+
+    def __init__(self, font='NotoEmoji-Regular', fsize=23, color="#0099ff",
+                 bgcolor=None, directory=None):
+        self.font = font
+        self.fsize = fsize
+        if directory is None:
+            directory = os.path.join(utils.cache_dir(), 'sprites')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(
+            directory, pack_name(font, fsize)[:-len('.fpak')] + '.fspr')
+        self.rows = None
+        self._palette = _palette(color, bgcolor or utils.term.bgcolor)
+        self._glyphs = {}
+        self._index = {}
+        self._mm = None
+        self._end = 0
+        self._ino = None
+        self._corrupt = False
+        self._face = None
+        self._lock = threading.Lock()
+        self._refresh()
+        if self.rows is None:
+            self.rows = sum(self._get_face().getmetrics()) // 2
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __contains__(self, char):
+        return ord(char) in self._index
+
+    def glyph(self, char):
+        """Returns ``(offset, rows, advance)`` like :class:`Pack`"""
+        glyph = self._glyphs.get(char)
+        if glyph is not None:
+            return glyph
+        with self._lock:
+            code = ord(char)
+            if code not in self._index:
+                # another process might have drawn it since
+                self._refresh()
+            entry = self._index.get(code)
+            if entry is not None:
+                (offset, width, advance, start) = entry
+                data = self._mm[start:start + width * self.rows]
+            else:
+                (offset, width, advance, data) = self._add(char)
+            glyph = self._glyphs[char] = (
+                offset, _colorize(data, width, self._palette), advance / 64.0)
+        return glyph
+
+    def kerning(self, left, right):
+        return 0.0
+
+    def _refresh(self):
+        """Maps the file again and indexes any new records"""
+        try:
+            fp = io.open(self.path, 'rb')
+        except (IOError, OSError):
+            return
+        with fp:
+            st = os.fstat(fp.fileno())
+            size = st.st_size
+            if self._ino is not None and (st.st_ino != self._ino or
+                                          size < self._end):
+                # another process started the file over, so none of
+                # the offsets we know are any good
+                self._index = {}
+                self._glyphs = {}
+                self._end = 0
+                self._corrupt = False
+            if size <= self._end or size < len(MAGIC) + SPRITE_HEADER.size:
+                return
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.close()
+        self._mm = mm
+        self._ino = st.st_ino
+        pos = self._end
+        if not pos:
+            (fsize, rows) = SPRITE_HEADER.unpack_from(mm, len(MAGIC))
+            if mm[:len(MAGIC)] != SPRITE_MAGIC or fsize != self.fsize:
+                self._corrupt = True
+                return
+            self.rows = rows
+            pos = len(MAGIC) + SPRITE_HEADER.size
+        while pos + GLYPH.size <= size:
+            (code, offset, width, advance, crc) = GLYPH.unpack_from(mm, pos)
+            start = pos + GLYPH.size
+            end = start + width * self.rows
+            if end > size:
+                break  # still being written, or cut short
+            if zlib.crc32(mm[start:end]) & 0xffffffff != crc:
+                self._corrupt = True
+                break
+            self._index[code] = (offset, width, advance, start)
+            pos = end
+        self._end = pos
+
+    def _add(self, char):
+        """Draws a glyph and appends it to the file"""
+        (offset, width, advance, data) = _coverage(self._get_face(), char)
+        data = bytes(data)
+        record = GLYPH.pack(ord(char), offset, width, advance,
+                            zlib.crc32(data) & 0xffffffff) + data
+        try:
+            if self._corrupt or not self._end:
+                self._rewrite()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                # one write, so records from other processes don't mix
+                os.write(fd, record)
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
+            pass
+        return (offset, width, advance, data)
+
+    def _rewrite(self):
+        """Starts the file over with just the records that are good"""
+        out = [SPRITE_MAGIC, SPRITE_HEADER.pack(self.fsize, self.rows)]
+        for (code, (offset, width, advance, start)) in self._index.items():
+            data = self._mm[start:start + width * self.rows]
+            out.append(GLYPH.pack(code, offset, width, advance,
+                                  zlib.crc32(data) & 0xffffffff) + data)
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with io.open(tmp, 'wb') as fp:
+            fp.write(b''.join(out))
+        os.rename(tmp, self.path)
+        # offsets changed, so index the new file from the top next time
+        self._index = {}
+        self._end = 0
+        self._ino = None
+        self._corrupt = False
+
+    def _get_face(self):
+        if self._face is None:
+            from fabulous import text
+            utils.pil_check()
+            self._face = text.get_font(self.font, self.fsize)
+        return self._face
+
+
+def _coverage(face, char):
+    """Draws a glyph and shrinks it to cells
+
+    :return: ``(offset, width, advance, coverage)``, where ``advance``
+             is in 64ths of a cell and ``coverage`` has a byte per cell,
+             quantized to sixteen levels.
+    """
+    from PIL import Image, ImageDraw
+    (left, _, right, _) = face.getbbox(char)
+    offset = min(0, left)
+    width = max(0, right - offset)
+    advance = int(round(face.getlength(char) * 64))
+    if not width:
+        return (offset, width, advance, bytearray())
+    (ascent, descent) = face.getmetrics()
+    img = Image.new("RGBA", (width, ascent + descent), (0, 0, 0, 0))
+    ImageDraw.Draw(img).text((-offset, 0), char, font=face,
+                             fill=(255, 255, 255, 255))
+    rows = (ascent + descent) // 2
+    alpha = bytearray(img.resize((width, rows)).tobytes()[3::4])
+    return (offset, width, advance,
+            bytearray((a + 8) // 17 * 17 for a in alpha))
+
+
+def _colorize(data, width, palette):
+    """Turns coverage bytes into rows of xterm colors"""
+    data = bytearray(data)
+    if not width:
+        return []
+    return [[palette[v] for v in data[n:n + width]]
+            for n in range(0, len(data), width)]
+
+
+def _palette(color, bgcolor):
+    """Returns the xterm color for each level of coverage
+
+    Partly covered cells are blended into the background the same way
+    :meth:`fabulous.image.Image.convert` blends translucent pixels.
+    """
+    color = grapefruit.Color.NewFromHtml(color)
+    palette = [None] * 256
+    for alpha in range(17, 256, 17):
+        if alpha == 255:
+            rgb = color.rgb
+        else:
+            rgb = grapefruit.Color.AlphaBlend(
+                grapefruit.Color.NewFromRgb(*(color.rgb + (alpha / 255.0,))),
+                bgcolor).rgb
+        palette[alpha] = xterm256.rgb_to_xterm(
+            *[int(c * 255.0) for c in rgb])
+    return palette
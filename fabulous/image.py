@@ -25,11 +25,45 @@
 
 """
 
+import io
+import os
+import re
 import sys
+import time
+import zlib
+import signal
+import struct
+import base64
+import binascii
+import tempfile
+import functools
 import itertools
+import collections
 
-from fabulous import utils, xterm256, grapefruit
-from fabulous.compatibility import printy
+from fabulous import utils, xterm256, grapefruit, pixmap, runs
+
+try:
+    unichr = unichr
+except NameError:
+    unichr = chr
+
+# braille dot bit for each (y, x) position within a cell
+DOTS = ((0x01, 0x08), (0x02, 0x10), (0x04, 0x20), (0x40, 0x80))
+
+# 4x2 ordered dithering matrix
+BAYER = ((0, 4), (6, 2), (1, 5), (7, 3))
+
+# luminance weights, scaled so the three terms never carry past a byte
+_LUMA = [bytes(bytearray(v * w >> 8 for v in range(256)))
+         for w in (77, 150, 29)]
+_OPAQUE = bytes(bytearray(0xff if v >= 128 else 0 for v in range(256)))
+
+# six vertical pixels become a character by adding 63
+_SIXELS = bytes(bytearray((v + 63) & 0xff for v in range(256)))
+_SIXEL_RUNS = re.compile(r'(.)\1{3,}')
+
+# kitty graphics protocol transmission medium codes
+KITTY_MEDIA = {'shm': 's', 'file': 't', 'direct': 'd'}
 
 
 class Image(object):
@@ -60,17 +94,18 @@ class Image(object):
     background colors.  In the future routines will be provided to
     overlay text on top of these images.
 
+    Binary Netpbm files (PGM, PPM and PAM) don't need :mod:`PIL` at
+    all.  They're memory mapped by :mod:`fabulous.pixmap` instead.
+    You can also pass me an image that's already been opened, such as
+    a raw RGB dump from :func:`fabulous.pixmap.open`.
+
     """
 
     pad = ' '
+    _runs = None
 
     def __init__(self, path, width=None):
-        utils.pil_check()
-        from PIL import Image as PillsPillsPills
-        self.img = PillsPillsPills.open(path)
-        # when reading pixels, gifs will return colors corresponding
-        # to a palette if we don't do this :\
-        self.img = self.img.convert("RGBA")
+        self.img = load(path)
         self.resize(width)
 
     def __iter__(self):
@@ -83,7 +118,7 @@ class Image(object):
         :return: Yields lines of text (without line end character)
         """
         # strip out blank lines
-        for line in self.reduce(self.convert()):
+        for line in self._lines():
             if line.strip():
                 yield line
         yield ""
@@ -98,6 +133,63 @@ class Image(object):
         """
         return "\n".join(self)
 
+    def write_to(self, stream, chunk_size=65536):
+        """I write the entire image to a stream in large chunks
+
+        This is the fastest way to print an image.  Lines are encoded
+        as UTF-8 into one reusable buffer, which is written whenever it
+        grows past ``chunk_size`` bytes.  The stream is flushed once at
+        the end.  The output is the same as printing each line::
+
+            image.Image("balls.png").write_to(sys.stdout)
+
+        :param stream: A binary or text file object, or a raw file
+                       descriptor number.
+        """
+        write_pieces(stream, self._pieces(), chunk_size)
+
+    @classmethod
+    def open_async(cls, path, width=None, executor=None):
+        """I open an image without blocking the :mod:`asyncio` event loop
+
+        Decoding and resizing happen in ``executor`` (or the loop's
+        default one)::
+
+            img = await image.Image.open_async("balls.png")
+
+        :return: An awaitable of the image.  See :mod:`fabulous.aio`.
+        """
+        from fabulous import aio
+        return aio.open_image(cls, path, width, executor)
+
+    def aiter(self, executor=None, batch=None):
+        """I'm the :mod:`asyncio` version of iterating over an image
+
+        Rows are converted in ``executor``, ``batch`` at a time, so a
+        big image doesn't stall other coroutines::
+
+            async for line in img.aiter():
+                print(line)
+
+        :return: An async iterator of lines.  See :mod:`fabulous.aio`.
+        """
+        from fabulous import aio
+        return aio.lines(self, executor, batch or aio.BATCH)
+
+    def render_async(self, executor=None, batch=None):
+        """I'm the :mod:`asyncio` version of :meth:`__str__`
+
+        :return: An awaitable of the entire image as one string.
+        """
+        from fabulous import aio
+        return aio.render(self, executor, batch or aio.BATCH)
+
+    def _pieces(self):
+        """Yields the text :meth:`write_to` should write, in order"""
+        for line in self:
+            yield line
+            yield "\n"
+
     @property
     def size(self):
         """Returns size of image
@@ -109,6 +201,10 @@ class Image(object):
 
         Called by the constructor automatically.
         """
+        self.img = self.img.resize(self._fit(width))
+
+    def _fit(self, width=None):
+        """Returns ``(width, height)`` the image should be resized to"""
         (iw, ih) = self.size
         if width is None:
             width = min(iw, utils.term.width)
@@ -116,8 +212,8 @@ class Image(object):
             percents = dict([(pct, '%s%%' % (pct)) for pct in range(101)])
             width = percents[width]
         height = int(float(ih) * (float(width) / float(iw)))
-        height //= 2
-        self.img = self.img.resize((width, height))
+        height = max(1, height // 2)
+        return (width, height)
 
     def reduce(self, colors):
         """Converts color codes into optimized text
@@ -131,29 +227,49 @@ class Image(object):
                        ``'EOL'`` to indicate th end of a line.
 
         :return: Yields lines of optimized text.
+        """
+        for row in runs.iter_rows(colors):
+            yield self.format_row(row)
+
+    def format_row(self, row):
+        """Turns one row of :mod:`fabulous.runs` into a line of text"""
+        return runs.xterm256_line(row, self.pad)
+
+    def _lines(self):
+        """Yields lines of text for :meth:`__iter__`
 
+        As a side effect I remember the runs, so printing the same
+        image again won't need to quantize it again.  See :meth:`runs`.
         """
-        need_reset = False
-        line = []
-        for color, items in itertools.groupby(colors):
-            if color is None:
-                if need_reset:
-                    line.append("\x1b[49m")
-                    need_reset = False
-                line.append(self.pad * len(list(items)))
-            elif color == "EOL":
-                if need_reset:
-                    line.append("\x1b[49m")
-                    need_reset = False
-                    yield "".join(line)
-                else:
-                    line.pop()
-                    yield "".join(line)
-                line = []
-            else:
-                need_reset = True
-                line.append("\x1b[48;5;%dm%s" % (
-                    color, self.pad * len(list(items))))
+        cached = self._cached_runs()
+        if cached is not None:
+            for row in cached.rows:
+                yield self.format_row(row)
+            return
+        rows = []
+        for row in runs.iter_rows(self.convert()):
+            rows.append(row)
+            yield self.format_row(row)
+        self._runs = (self.img, runs.Runs(rows))
+
+    def runs(self):
+        """Returns the converted image as :class:`fabulous.runs.Runs`
+
+        The image is only quantized once.  After that, the runs are
+        reused by iteration and by any other output format you ask
+        them for.
+        """
+        cached = self._cached_runs()
+        if cached is None:
+            cached = runs.Runs.from_colors(self.convert())
+            self._runs = (self.img, cached)
+        return cached
+
+    def _cached_runs(self):
+        """Returns runs for the current bitmap, if we've converted it"""
+        if self._runs is not None and self._runs[0] is self.img:
+            return self._runs[1]
+        return None
 
     def convert(self):
         """Yields xterm color codes for each pixel in image
@@ -177,6 +293,934 @@ class Image(object):
             yield "EOL"
 
 
+def load(path):
+    """Opens an image file as an RGBA bitmap
+
+    Images that have already been opened are passed through, and
+    converted to RGBA if they need to be.
+    """
+    if hasattr(path, 'getpixel'):
+        if getattr(path, 'mode', None) == "RGBA":
+            return path
+        return path.convert("RGBA")
+    if pixmap.sniff(path):
+        return pixmap.open(path)
+    utils.pil_check()
+    from PIL import Image as PillsPillsPills
+    img = PillsPillsPills.open(path)
+    # when reading pixels, gifs will return colors corresponding
+    # to a palette if we don't do this :\
+    return img.convert("RGBA")
+
+
+class LiveImage(object):
+    """Keeps an image fitted to the terminal as it gets resized
+
+    :class:`Image` measures the terminal once, when it's created.  I'm
+    meant for dashboards and other programs that redraw the screen.  I
+    decode the file once and keep it, then whenever the terminal is
+    resized (``SIGWINCH``) and settles down, I'll report that I'm
+    :meth:`stale` and :meth:`current` will render a new :class:`Image`
+    for the new width::
+
+        live = image.LiveImage("graph.png")
+        while True:
+            if live.stale():
+                redraw(live.current())
+            time.sleep(0.05)
+
+    Renders are cached by width, so resizing the terminal back and
+    forth, or resizing it without changing its width, doesn't quantize
+    anything again.
+
+    :param debounce: Seconds the terminal has to stop resizing before
+                     I'll say I'm stale.  This avoids rendering every
+                     intermediate size while a window is dragged.
+    :param cache:    How many widths to keep renders for.
+    """
+
+    debounce = 0.15
+
+    def __init__(self, path, cls=Image, debounce=None, cache=4):
+        if debounce is not None:
+            self.debounce = debounce
+        self.cls = cls
+        self.source = load(path)
+        self.renders = collections.OrderedDict()
+        self.cache = cache
+        self.width = None
+        self._seen = _watch_resizes()
+
+    def fit(self):
+        """Returns the width I'd be rendered at right now"""
+        return min(self.source.size[0], utils.term.width)
+
+    def stale(self):
+        """Returns true if the terminal's width changed since :meth:`current`
+
+        While the terminal is still being resized I'll keep saying no.
+        Asking doesn't change anything, so I'll keep saying yes until
+        :meth:`current` is called.
+        """
+        if self.width is None:
+            return True
+        when = _resized[0]
+        if when is not None:
+            if when == self._seen or time.time() - when < self.debounce:
+                return False
+        return self.fit() != self.width
+
+    def current(self):
+        """Returns an :class:`Image` rendered for the terminal's width"""
+        self._seen = _resized[0]
+        width = self.fit()
+        img = self.renders.pop(width, None)
+        if img is None:
+            img = self.cls(self.source, width)
+        self.renders[width] = img
+        while len(self.renders) > self.cache:
+            self.renders.popitem(last=False)
+        self.width = width
+        return img
+
+
+# when the terminal was last resized, or None if we can't find out
+_resized = [None]
+
+
+def _watch_resizes():
+    """Installs a ``SIGWINCH`` handler, once, that updates :data:`_resized`
+
+    Any handler that was already installed still gets called.
+
+    :return: The current value of ``_resized[0]``.
+    """
+    if _resized[0] is None and hasattr(signal, 'SIGWINCH'):
+        previous = signal.getsignal(signal.SIGWINCH)
+
+        def on_resize(signum, frame):
+            _resized[0] = time.time()
+            if callable(previous):
+                previous(signum, frame)
+        try:
+            signal.signal(signal.SIGWINCH, on_resize)
+        except ValueError:
+            pass  # signals only work in the main thread
+        else:
+            _resized[0] = 0.0
+    return _resized[0]
+
+
+class TiledImage(Image):
+    """Printing huge image files with bounded memory
+
+    :class:`Image` decodes the whole file before shrinking it, which is
+    a problem for satellite imagery and scans that are bigger than
+    your RAM.  I decode the source a strip of rows at a time, shrink
+    each strip straight into the rows of output it covers, and throw it
+    away before reading the next one.  Peak memory is proportional to
+    ``source width * strip_height`` plus the (tiny) output.
+
+    I rely on the tile information :mod:`PIL` exposes to decode only
+    part of a file.  This works for uncompressed formats (BMP, TGA,
+    raw TIFF) and for uncompressed TIFF files stored in several strips
+    or tiles.  JPEG files are instead decoded with
+    :meth:`PIL.Image.Image.draft`, which lets libjpeg shrink them by up
+    to 8x while decoding.  Other formats (like PNG, or TIFF files that
+    are compressed, which PIL hands to libtiff in one piece) can't be
+    decoded in pieces.  Those are decoded whole, like :class:`Image`
+    does, but shrunk before they're converted to RGBA, so they don't
+    take any more memory than that.
+
+    :param strip_height: Maximum number of source rows to decode at
+                         once.
+    """
+
+    strip_height = 256
+
+    def __init__(self, path, width=None, strip_height=None):
+        if strip_height is not None:
+            self.strip_height = strip_height
+        if hasattr(path, 'getpixel') or pixmap.sniff(path):
+            # already bounded, only sampled rows are ever read
+            Image.__init__(self, path, width)
+            return
+        utils.pil_check()
+        self.path = path
+        self.img = self._reopen()
+        self.resize(width)
+
+    def resize(self, width=None):
+        (ow, oh) = self._fit(width)
+        if not hasattr(self.img, 'tile'):
+            self.img = self.img.resize((ow, oh))
+            return
+        src = self._reopen()
+        (iw, ih) = src.size
+        if _strip_tiles(src, 0, 1) is None:
+            src.draft('RGB', (ow, oh * 2))
+            # this decodes everything at once, so PIL's limit applies
+            _bomb_check(src.size)
+            if src.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                # palettes and such can't be resampled as they are
+                src = src.convert("RGBA")
+            self.img = src.resize((ow, oh)).convert("RGBA")
+            return
+        from PIL import Image as PillsPillsPills
+        out = PillsPillsPills.new("RGBA", (ow, oh), (0, 0, 0, 0))
+        step = max(1, self.strip_height * oh // ih)
+        for top in range(0, oh, step):
+            bottom = min(oh, top + step)
+            strip = self._read_rows(top * ih // oh, bottom * ih // oh)
+            out.paste(strip.convert("RGBA").resize((ow, bottom - top)),
+                      (0, top))
+            del strip
+        self.img = out
+
+    def _reopen(self):
+        """Opens a fresh lazy copy of the source, which only reads headers
+
+        :func:`PIL.Image.open` refuses images with more pixels than
+        :data:`PIL.Image.MAX_IMAGE_PIXELS` (about 179 million) to guard
+        against decompression bombs.  That guard is about decoding the
+        whole image into memory, which I never do, and it would reject
+        exactly the huge images I exist for.  So the header is read by
+        :func:`_open_unchecked`, and the limit is enforced by
+        :meth:`resize` if the image turns out to need decoding in one
+        go.
+        """
+        if hasattr(self.path, 'seek'):
+            self.path.seek(0)
+        return _open_unchecked(self.path)
+
+    def _read_rows(self, top, bottom):
+        """Decodes rows ``[top, bottom)`` of the source image"""
+        src = self._reopen()
+        bottom = max(bottom, top + 1)
+        tiles = _strip_tiles(src, top, bottom)
+        first = min(tile[1][1] for tile in tiles)
+        last = max(tile[1][3] for tile in tiles)
+        src.tile = [(tile[0],
+                     (tile[1][0], tile[1][1] - first,
+                      tile[1][2], tile[1][3] - first)) + tuple(tile[2:])
+                    for tile in tiles]
+        if hasattr(src, '_size'):
+            src._size = (src.size[0], last - first)
+        else:
+            src.size = (src.size[0], last - first)
+        return src.crop((0, top - first, src.size[0], bottom - first))
+
+
+class BrailleImage(Image):
+    """Printing images with Unicode braille characters
+
+    Each character cell holds a 2x4 grid of braille dots, which gives
+    me eight times the resolution of :class:`Image`.  Dots are lit
+    when a pixel is opaque and its luminance is at least
+    ``threshold``.  Each cell gets a single foreground color, which is
+    the mean of the pixels that lit up.  This works best for line art,
+    plots and text bitmaps::
+
+        jart@compy:~$ fabulous-image --braille plot.png
+
+    :param threshold: Minimum luminance (0-255) of a lit dot.
+
+    :param dither:    Use ordered dithering instead of a fixed
+                      threshold, which works better for photos.
+    """
+
+    pad = ' '
+    threshold = 128
+    dither = False
+
+    def __init__(self, path, width=None, threshold=None, dither=None):
+        if threshold is not None:
+            self.threshold = threshold
+        if dither is not None:
+            self.dither = dither
+        Image.__init__(self, path, width)
+
+    def _fit(self, width=None):
+        (width, height) = Image._fit(self, width)
+        return (width * 2, height * 4)
+
+    def runs(self):
+        raise TypeError("BrailleImage cells can't be stored as runs")
+
+    def __iter__(self):
+        # unlike Image, blank rows are kept since dark bands are part of
+        # the picture
+        for line in self.reduce(self.convert()):
+            yield line
+        yield ""
+
+    def reduce(self, cells):
+        """Merges adjacent cells of the same color into one escape code
+
+        :param cells: Iterable yielding ``(color, char)`` for each cell,
+                      None for a blank cell, or ``'EOL'``.
+        """
+        current = None
+        line = []
+        key = lambda cell: cell if cell in (None, "EOL") else cell[0]
+        for color, items in itertools.groupby(cells, key):
+            if color is None:
+                # blank cells don't care what the foreground color is
+                line.append(self.pad * len(list(items)))
+            elif color == "EOL":
+                line = ["".join(line).rstrip(self.pad)]
+                if current is not None:
+                    line.append("\x1b[39m")
+                    current = None
+                yield "".join(line)
+                line = []
+            else:
+                if color != current:
+                    line.append("\x1b[38;5;%dm" % color)
+                    current = color
+                line.append("".join(char for _, char in items))
+
+    def convert(self):
+        """Yields ``(color, char)`` for each braille cell in image"""
+        (width, height) = self.img.size
+        data = bytearray(self.img.tobytes())
+        stride = width * 4
+        tables = self._tables()
+        for top in range(0, height - 3, 4):
+            rows = [data[(top + dy) * stride:(top + dy + 1) * stride]
+                    for dy in range(4)]
+            bits = 0
+            for dy, row in enumerate(rows):
+                luma = _luma(row)
+                for dx in (0, 1):
+                    lit = _to_int(luma[dx::2].translate(tables[dy][dx]))
+                    opaque = _to_int(row[dx * 4 + 3::8].translate(_OPAQUE))
+                    bits |= lit & opaque
+            for cx, mask in enumerate(bytearray(_from_int(bits, width // 2))):
+                if mask:
+                    yield (self._color(rows, cx, mask),
+                           unichr(0x2800 + mask))
+                else:
+                    yield None
+            yield "EOL"
+
+    def _tables(self):
+        """Returns translation tables mapping luminance to dot bits"""
+        tables = []
+        for dy in range(4):
+            tables.append([])
+            for dx in (0, 1):
+                if self.dither:
+                    threshold = (BAYER[dy][dx] * 2 + 1) * 256 // 16
+                else:
+                    threshold = self.threshold
+                bit = DOTS[dy][dx]
+                tables[dy].append(bytes(bytearray(
+                    bit if v >= threshold else 0 for v in range(256))))
+        return tables
+
+    def _color(self, rows, cx, mask):
+        """Returns xterm color for the mean of the lit pixels in a cell"""
+        total = [0, 0, 0]
+        count = 0
+        for dy, row in enumerate(rows):
+            for dx in (0, 1):
+                if mask & DOTS[dy][dx]:
+                    n = (cx * 2 + dx) * 4
+                    for c in range(3):
+                        total[c] += row[n + c]
+                    count += 1
+        return xterm256.rgb_to_xterm(*[t // count for t in total])
+
+
+class KittyImage(Image):
+    """Printing images at full resolution with the kitty graphics protocol
+
+    Terminals like kitty can display real pixels.  I send your image at
+    its native resolution, so there's no quantizing or :meth:`reduce`
+    pass, and ask the terminal to scale it to the same number of
+    columns :class:`Image` would have used.
+
+    The pixels can travel to the terminal in a few ways:
+
+    - ``'shm'`` puts them in a POSIX shared memory object and only
+      sends its name over the tty.  The terminal unlinks it once read.
+      This needs Python 3.8 or newer.
+
+    - ``'file'`` does the same with a temporary file.
+
+    - ``'direct'`` sends zlib compressed base64 over the tty, which is
+      the only option that works over SSH.
+
+    The default, ``'auto'``, picks ``'shm'`` when it's available and
+    we're not in an SSH session, otherwise ``'direct'``.
+
+    The whole image is a single line of escape codes::
+
+        image.KittyImage("balls.png").write_to(sys.stdout)
+
+    """
+
+    chunk_size = 4096
+    name = None
+    _escape = None
+
+    def __init__(self, path, width=None, medium='auto'):
+        if medium == 'auto':
+            medium = 'shm' if _shm_usable() else 'direct'
+        if medium not in KITTY_MEDIA:
+            raise ValueError("Unknown kitty medium %r" % medium)
+        self.medium = medium
+        Image.__init__(self, path, width)
+
+    def resize(self, width=None):
+        """Remembers how many columns the terminal should scale us to"""
+        self.columns = self._fit(width)[0]
+
+    def runs(self):
+        raise TypeError("KittyImage sends pixels, it doesn't have runs")
+
+    def __iter__(self):
+        yield self.escape()
+        yield ""
+
+    def escape(self):
+        """Returns the escape codes that transmit and display the image
+
+        With the ``'shm'`` and ``'file'`` media, the shared memory
+        object or file is only created the first time I'm called, and
+        the same escape codes are returned after that.  The terminal
+        deletes it once it's displayed, so printing me twice will only
+        work with ``'direct'``.  If you never print me, call
+        :meth:`close` so it doesn't linger.
+        """
+        if self._escape is not None:
+            return self._escape
+        (width, height) = self.size
+        data = self.img.tobytes()
+        keys = "a=T,f=32,s=%d,v=%d,c=%d,q=2" % (width, height, self.columns)
+        if self.medium == 'direct':
+            return self._direct(keys, zlib.compress(data))
+        if self.medium == 'shm':
+            self.name = _shm_write(data)
+        else:
+            self.name = _tempfile_write(data)
+        payload = base64.b64encode(self.name.encode('utf-8')).decode('ascii')
+        self._escape = "\x1b_G%s,t=%s,S=%d;%s\x1b\\" % (
+            keys, KITTY_MEDIA[self.medium], len(data), payload)
+        return self._escape
+
+    def close(self):
+        """Deletes the shared memory object or file, if the terminal hasn't
+
+        The escape codes from :meth:`escape` are useless after this.
+        """
+        (name, self.name, self._escape) = (self.name, None, None)
+        if name is None:
+            return
+        try:
+            if self.medium == 'shm':
+                from multiprocessing import shared_memory
+                shm = shared_memory.SharedMemory(name.lstrip('/'))
+                shm.close()
+                shm.unlink()
+            else:
+                os.unlink(name)
+        except (IOError, OSError):
+            pass
+
+    def _direct(self, keys, data):
+        payload = base64.b64encode(data).decode('ascii')
+        chunks = [payload[n:n + self.chunk_size]
+                  for n in range(0, len(payload), self.chunk_size)] or [""]
+        out = []
+        for n, chunk in enumerate(chunks):
+            more = int(n < len(chunks) - 1)
+            if n == 0:
+                out.append("\x1b_G%s,t=d,o=z,m=%d;%s\x1b\\" % (
+                    keys, more, chunk))
+            else:
+                out.append("\x1b_Gm=%d;%s\x1b\\" % (more, chunk))
+        return "".join(out)
+
+
+class SixelImage(Image):
+    """Printing images with the Sixel graphics protocol
+
+    Terminals like xterm (with ``-ti vt340``), mlterm and foot can draw
+    Sixel graphics, which have real pixels.  I resize your image to
+    fill the same number of columns :class:`Image` would, measured in
+    pixels using :attr:`fabulous.utils.TerminalInfo.cell_size`.
+
+    Colors are quantized by :meth:`convert` just like :class:`Image`,
+    so each xterm color id doubles as a Sixel color register.  A
+    register is only defined the first time its color shows up, runs of
+    identical columns are compressed with Sixel's ``!n`` repeat
+    introducer, and transparent pixels are left alone.
+
+    The image is encoded six rows (one band) at a time, so
+    :meth:`write_to` can start writing before the whole image has been
+    quantized.
+
+    :param cell_size: Size of a character cell in pixels, if your
+                      terminal doesn't report it.
+    """
+
+    cell_size = None
+
+    def __init__(self, path, width=None, cell_size=None):
+        if cell_size is not None:
+            self.cell_size = cell_size
+        Image.__init__(self, path, width)
+
+    def resize(self, width=None):
+        (columns, _) = self._fit(width)
+        (cell_width, _) = self.cell_size or utils.term.cell_size
+        (iw, ih) = self.size
+        width = columns * cell_width
+        self.img = self.img.resize((width, max(1, ih * width // iw)))
+
+    def __iter__(self):
+        yield "".join(self.sixels())
+        yield ""
+
+    def _pieces(self):
+        for piece in self.sixels():
+            yield piece
+        yield "\n"
+
+    def runs(self):
+        raise TypeError("SixelImage sends pixels, it doesn't have runs")
+
+    def sixels(self):
+        """Yields the Sixel escape codes for the image, one band at a time
+        """
+        (width, height) = self.img.size
+        defined = set()
+        yield '\x1bP0;1q"1;1;%d;%d' % (width, height)
+        rows = []
+        row = []
+        # "-" moves down to the next band, so it only goes between bands
+        newline = ""
+        for color in self.convert():
+            if color != "EOL":
+                row.append(color)
+                continue
+            rows.append(row)
+            row = []
+            if len(rows) == 6:
+                yield newline + self._band(rows, defined)
+                newline = "-"
+                rows = []
+        if rows:
+            yield newline + self._band(rows, defined)
+        yield "\x1b\\"
+
+    def _band(self, rows, defined):
+        """Encodes up to six rows of xterm color ids as Sixel data
+
+        :param defined: Set of color registers that have already been
+                        defined.  I'll add any new colors to it.
+        """
+        masks = {}
+        order = []
+        for dy, row in enumerate(rows):
+            bit = 1 << dy
+            for x, color in enumerate(row):
+                if color is None:
+                    continue
+                mask = masks.get(color)
+                if mask is None:
+                    mask = masks[color] = bytearray(len(row))
+                    order.append(color)
+                mask[x] |= bit
+        out = []
+        for color in order:
+            if color in defined:
+                select = "#%d" % color
+            else:
+                defined.add(color)
+                select = "#%d;2;%d;%d;%d" % ((color,) + tuple(
+                    (c * 100 + 127) // 255
+                    for c in xterm256.xterm_to_rgb(color)))
+            sixels = masks[color].translate(_SIXELS).decode('ascii')
+            out.append(select + _SIXEL_RUNS.sub(_sixel_repeat,
+                                                sixels.rstrip('?')))
+        # "$" returns to the start of the band
+        return "$".join(out)
+
+
+def write_pieces(stream, pieces, chunk_size=65536):
+    """Writes strings to a stream in large UTF-8 encoded chunks
+
+    This is how :meth:`Image.write_to` does its writing.
+
+    :param stream: A binary or text file object, or a raw file
+                   descriptor number.  Text streams that don't wrap a
+                   binary buffer (like :class:`io.StringIO`) are given
+                   text instead of bytes.
+    :param pieces: Iterable of strings to write.  Nothing is added
+                   between them.
+    """
+    if isinstance(stream, int):
+        write = lambda data: _write_fd(stream, data)
+        flush = None
+    else:
+        if hasattr(stream, 'buffer'):
+            # don't let our bytes jump ahead of buffered text
+            stream.flush()
+            stream = stream.buffer
+        elif isinstance(stream, io.TextIOBase):
+            _write_text(stream, pieces, chunk_size)
+            return
+        write = functools.partial(_write_all, stream.write)
+        flush = getattr(stream, 'flush', None)
+    buf = bytearray()
+    for piece in pieces:
+        if not isinstance(piece, bytes):
+            piece = piece.encode('utf-8')
+        buf += piece
+        if len(buf) >= chunk_size:
+            write(buf)
+            del buf[:]
+    if buf:
+        write(buf)
+    if flush is not None:
+        flush()
+
+
+def _write_text(stream, pieces, chunk_size):
+    """Writes strings to a text stream in chunks of about ``chunk_size``"""
+    buf = []
+    size = 0
+    for piece in pieces:
+        if isinstance(piece, bytes):
+            piece = piece.decode('utf-8')
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            stream.write("".join(buf))
+            buf = []
+            size = 0
+    if buf:
+        stream.write("".join(buf))
+    stream.flush()
+
+
+def _write_all(write, data):
+    """Calls ``write`` until all of ``data`` is written
+
+    Unbuffered raw streams may write less than they're given and
+    return how much they took.  Streams that return None are assumed
+    to have taken everything.
+    """
+    count = write(data)
+    while count is not None and count < len(data):
+        data = data[count:]
+        count = write(data)
+
+
+def thumbnail(path, width=16, height=None):
+    """Opens an image shrunk to fit inside a box of character cells
+
+    This is faster than :class:`Image` for big files because JPEGs are
+    shrunk while they're decoded (see :meth:`PIL.Image.Image.draft`).
+
+    :param height: Height of the box in lines.  Defaults to half the
+                   width, which is square on most terminals.
+
+    :return: An :class:`Image`.
+    """
+    if height is None:
+        height = max(1, width // 2)
+    if hasattr(path, 'getpixel'):
+        img = path
+    elif pixmap.sniff(path):
+        img = pixmap.open(path)
+    else:
+        utils.pil_check()
+        from PIL import Image as PillsPillsPills
+        img = PillsPillsPills.open(path)
+        img.draft('RGB', (width, height * 2))
+    (iw, ih) = img.size
+    # pixels are half as tall as they are wide
+    columns = min(width, max(1, iw * height * 2 // max(1, ih)))
+    return Image(img, columns)
+
+
+def grid(paths, width=None, thumb_width=16, gap=2, labels=True,
+         workers=8):
+    """Yields lines of a contact sheet of thumbnails
+
+    This is handy for browsing a directory full of images::
+
+        jart@compy:~$ fabulous-image --grid ~/screenshots
+
+    Images are decoded by a pool of ``workers`` threads (the slow part
+    of decoding happens inside :mod:`PIL` which lets go of the GIL)
+    and printed in order as soon as each row of the grid is ready.
+    Files that can't be read are skipped.
+
+    :param width:       Width of the grid in characters.  Defaults to
+                        the width of the terminal.
+    :param thumb_width: Width of each thumbnail in characters.
+    :param gap:         Spaces between thumbnails.
+    :param labels:      Print each file's name beneath its thumbnail.
+    """
+    if width is None:
+        width = utils.term.width
+    per_row = max(1, (width + gap) // (thumb_width + gap))
+    render = functools.partial(_grid_cell, thumb_width=thumb_width,
+                               labels=labels)
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        cells = (render(path) for path in paths)
+        executor = None
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        cells = _bounded_map(executor, render, paths, workers * 2)
+    try:
+        row = []
+        for cell in cells:
+            if cell is None:
+                continue
+            row.append(cell)
+            if len(row) == per_row:
+                for line in _grid_row(row, thumb_width, gap):
+                    yield line
+                row = []
+        if row:
+            for line in _grid_row(row, thumb_width, gap):
+                yield line
+    finally:
+        if executor is not None:
+            cells.close()
+            executor.shutdown(wait=False)
+
+
+def _bounded_map(executor, function, items, window):
+    """Like :meth:`Executor.map` but only ``window`` calls are queued
+
+    Closing me cancels whatever hasn't started yet, so a consumer that
+    stops early (like ``| head``) doesn't leave thousands of decodes
+    running.
+    """
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _grid_cell(path, thumb_width, labels):
+    """Renders one thumbnail as ``[(line, visible width), ...]``"""
+    try:
+        img = thumbnail(path, thumb_width)
+        rows = img.runs().rows
+    except _unreadable():
+        return None
+    cell = [(runs.xterm256_line(row, img.pad), _visible(row))
+            for row in rows]
+    if labels:
+        label = os.path.basename(path)[:thumb_width]
+        cell.append((label, len(label)))
+    return cell
+
+
+def _unreadable():
+    """Returns the exceptions that mean an image file can't be read"""
+    errors = (IOError, OSError, ValueError)
+    try:
+        from PIL import Image as PillsPillsPills
+    except ImportError:
+        return errors
+    bomb = getattr(PillsPillsPills, 'DecompressionBombError', None)
+    return errors + (bomb,) if bomb is not None else errors
+
+
+def _visible(row):
+    """Returns how many columns a line of runs will take up"""
+    width = sum(row[1::2])
+    if row and row[-2] == runs.TRANSPARENT:
+        width -= row[-1]  # trailing transparency isn't printed
+    return width
+
+
+def _grid_row(cells, thumb_width, gap):
+    """Yields lines that put thumbnails side by side"""
+    height = max(len(cell) for cell in cells)
+    for y in range(height):
+        line = []
+        for cell in cells:
+            # thumbnails hang from the bottom so labels line up
+            n = y - (height - len(cell))
+            (text, visible) = cell[n] if n >= 0 else ("", 0)
+            line.append(text + " " * (thumb_width - visible))
+        yield (" " * gap).join(line).rstrip(" ")
+
+
+def _shm_usable():
+    """Returns true if kitty can be sent a shared memory object"""
+    if 'SSH_CONNECTION' in os.environ or 'SSH_TTY' in os.environ:
+        return False
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        return False
+    return os.name == 'posix'
+
+
+def _shm_write(data):
+    """Copies ``data`` into a new POSIX shared memory object
+
+    The terminal unlinks the object after reading it, so I make sure
+    Python's resource tracker doesn't unlink it first.
+
+    :return: Name of the shared memory object.
+    """
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(create=True, size=len(data),
+                                         track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(create=True, size=len(data))
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister("/" + shm.name, 'shared_memory')
+    shm.buf[:len(data)] = data
+    shm.close()
+    return "/" + shm.name
+
+
+def _tempfile_write(data):
+    """Copies ``data`` into a temporary file the terminal will delete
+
+    Kitty only deletes files whose name says they're meant for it.
+
+    :return: Path of the file.
+    """
+    (fd, path) = tempfile.mkstemp(prefix='tty-graphics-protocol-')
+    try:
+        _write_fd(fd, data)
+    finally:
+        os.close(fd)
+    return path
+
+
+def _sixel_repeat(match):
+    """Compresses a run of identical sixels with a repeat introducer"""
+    return "!%d%s" % (len(match.group(0)), match.group(1))
+
+
+def _write_fd(fd, data):
+    """Writes all of ``data`` to a raw file descriptor"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _to_int(data):
+    """Packs bytes into one big integer so whole rows can be or'd"""
+    return int(binascii.hexlify(data) or b'0', 16)
+
+
+def _from_int(number, length):
+    """Unpacks an integer from :func:`_to_int` back into bytes"""
+    return binascii.unhexlify('%0*x' % (length * 2, number))
+
+
+def _luma(rgba):
+    """Returns the luminance of each RGBA pixel as bytes
+
+    Each weighted channel is translated in C, then all three are added
+    as big integers.  The weights are chosen so no byte overflows.
+    """
+    total = 0
+    for c, table in enumerate(_LUMA):
+        total += _to_int(rgba[c::4].translate(table))
+    return _from_int(total, len(rgba) // 4)
+
+
+def _bomb_check(size):
+    """Raises PIL's decompression bomb error if ``size`` is too big"""
+    from PIL import Image as PillsPillsPills
+    check = getattr(PillsPillsPills, '_decompression_bomb_check', None)
+    if check is not None:
+        check(size)
+
+
+def _open_unchecked(path):
+    """Opens an image like :func:`PIL.Image.open`, whatever its size
+
+    This asks each of PIL's format plugins to read the header, just like
+    :func:`PIL.Image.open` does, minus the decompression bomb check, so
+    nobody has to touch :data:`PIL.Image.MAX_IMAGE_PIXELS`.
+    """
+    from PIL import Image as PillsPillsPills
+    if hasattr(path, 'read'):
+        (fp, filename) = (path, getattr(path, 'name', ''))
+    else:
+        (fp, filename) = (open(path, 'rb'), path)
+    prefix = fp.read(16)
+    for init in (PillsPillsPills.preinit, PillsPillsPills.init):
+        init()
+        for name in PillsPillsPills.ID:
+            (factory, accept) = PillsPillsPills.OPEN[name]
+            if accept:
+                accepted = accept(prefix)
+                # newer PILs return a warning message for near misses
+                if not accepted or isinstance(accepted, str):
+                    continue
+            fp.seek(0)
+            try:
+                img = factory(fp, filename)
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+            if fp is not path:
+                img._exclusive_fp = True
+            return img
+    if fp is not path:
+        fp.close()
+    raise IOError("cannot identify image file %r" % (filename,))
+
+
+def _strip_tiles(img, top, bottom):
+    """Returns PIL tiles that decode rows ``[top, bottom)`` of ``img``
+
+    Returns None if the image can't be decoded in pieces.
+    """
+    if len(img.tile) > 1:
+        return [tile for tile in img.tile
+                if tile[1][1] < bottom and tile[1][3] > top]
+    if len(img.tile) != 1 or img.tile[0][0] != 'raw':
+        return None
+    (decoder, extents, offset, args) = tuple(img.tile[0])[:4]
+    if extents != (0, 0) + img.size:
+        return None
+    if not isinstance(args, tuple):
+        args = (args,)
+    (rawmode, stride, ystep) = (args + (0, 1))[:3]
+    if not stride:
+        if rawmode != img.mode:
+            return None
+        from PIL import Image as PillsPillsPills
+        stride = len(PillsPillsPills.new(img.mode, (img.size[0], 1)).tobytes())
+    if ystep == 1:
+        offset += top * stride
+    elif ystep == -1:
+        offset += (img.size[1] - bottom) * stride
+    else:
+        return None
+    return [(decoder, (0, top, img.size[0], bottom), offset,
+             (rawmode, stride, ystep))]
+
+
 def main():
     """Main function for :command:`fabulous-image`."""
     import optparse
@@ -184,10 +1228,69 @@ def main():
     parser.add_option(
         "-w", "--width", dest="width", type="int", default=None,
         help=("Width of printed image in characters.  Default: %default"))
+    parser.add_option(
+        "-r", "--raw", dest="raw", default=None, metavar="WxH",
+        help=("Treat files as headerless raw RGB pixels with the given "
+              "geometry, e.g. 640x480.  Default: %default"))
+    parser.add_option(
+        "-b", "--braille", dest="braille", action="store_true", default=False,
+        help=("Draw with braille characters for eight times the "
+              "resolution.  Default: %default"))
+    parser.add_option(
+        "-k", "--kitty", dest="kitty", default=None, metavar="MEDIUM",
+        help=("Print full resolution pixels with the kitty graphics "
+              "protocol, sent by 'auto', 'shm', 'file' or 'direct'.  "
+              "Default: %default"))
+    parser.add_option(
+        "-x", "--sixel", dest="sixel", action="store_true", default=False,
+        help=("Print real pixels with Sixel graphics.  Default: %default"))
+    parser.add_option(
+        "-g", "--grid", dest="grid", action="store_true", default=False,
+        help=("Print thumbnails of images (and of images in directories) "
+              "side by side.  Default: %default"))
+    parser.add_option(
+        "-T", "--thumb-width", dest="thumb_width", type="int", default=16,
+        help=("Width of thumbnails in grid mode.  Default: %default"))
+    parser.add_option(
+        "-t", "--tiled", dest="tiled", action="store_true", default=False,
+        help=("Decode huge images a strip at a time to bound memory "
+              "usage.  Default: %default"))
+    parser.add_option(
+        "-i", "--interactive", dest="interactive", action="store_true",
+        default=False,
+        help=("Zoom and pan around images with the keyboard.  Default: "
+              "%default"))
     (options, args) = parser.parse_args(args=sys.argv[1:])
+    if options.grid:
+        paths = []
+        for path in args:
+            if os.path.isdir(path):
+                paths.extend(os.path.join(path, name)
+                             for name in sorted(os.listdir(path)))
+            else:
+                paths.append(path)
+        lines = grid(paths, options.width, options.thumb_width)
+        write_pieces(sys.stdout, (line + "\n" for line in lines))
+        return
+    if options.interactive:
+        from fabulous import viewer
+        for imgpath in args:
+            lines = viewer.Viewer(imgpath).run()
+            if lines:
+                write_pieces(sys.stdout, (line + "\n" for line in lines))
+        return
+    cls = TiledImage if options.tiled else Image
+    if options.braille:
+        cls = BrailleImage
+    if options.sixel:
+        cls = SixelImage
+    if options.kitty:
+        cls = functools.partial(KittyImage, medium=options.kitty)
     for imgpath in args:
-        for line in Image(imgpath, options.width):
-            printy(line)
+        if options.raw:
+            size = tuple(int(n) for n in options.raw.lower().split("x"))
+            imgpath = pixmap.open(imgpath, size=size)
+        cls(imgpath, options.width).write_to(sys.stdout)
 
 
 if __name__ == '__main__':
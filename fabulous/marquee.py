@@ -0,0 +1,204 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.marquee
+    ~~~~~~~~~~~~~~~~
+
+    The marquee module scrolls big text across the terminal, like the
+    news ticker on a building::
+
+        jart@compy:~$ python -m fabulous.marquee 'Disk is 98% full'
+
+    Or as a Python library:
+
+    .. code-block:: python
+
+        from fabulous import marquee
+        marquee.Marquee("Disk is 98% full", color="red").play()
+
+    The text is drawn and quantized once, into a strip of cells that
+    wraps around.  Each frame is just the slice of the strip that fits
+    in the terminal, so animating doesn't touch :mod:`PIL` at all.
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import array
+
+from fabulous import utils, runs
+
+
+class Marquee(object):
+    """A strip of text that scrolls through a window of the terminal
+
+    For example::
+
+        >>> strip = runs.Runs.from_colors([196, 196, None, 21, 'EOL'])
+        >>> ticker = Marquee(strip, width=3, gap=1)
+        >>> ticker.frame(0)
+        ['\\x1b[48;5;196m  \\x1b[49m ']
+        >>> ticker.frame(3)
+        ['\\x1b[48;5;21m \\x1b[49m \\x1b[48;5;196m \\x1b[49m']
+
+    :param text:    The text to scroll.  Strings are drawn with
+                    :class:`fabulous.text.Text`.  You can also pass any
+                    :class:`fabulous.image.Image`, or
+                    :class:`fabulous.runs.Runs`.
+    :param width:   How many columns wide the window is.  Defaults to
+                    the width of the terminal.
+    :param gap:     How many blank columns to put between the end of
+                    the text and the start of the next time around.
+    :param options: Passed along to :class:`fabulous.text.Text`.
+    """
+
+    def __init__(self, text, width=None, gap=8, **options):
+        if isinstance(text, runs.Runs):
+            strip = text
+        else:
+            if not hasattr(text, 'runs'):
+                from fabulous import text as text_
+                text = text_.Text(text, shrink=False, **options)
+            strip = text.runs()
+        self.width = width or utils.term.width
+        (self.period, self.height) = strip.size
+        self.period += gap
+        if self.period < 1:
+            raise ValueError("There's nothing to scroll")
+        self.rows = [_Row(row, gap, self.period + self.width)
+                     for row in strip.rows]
+
+    def frame(self, offset):
+        """Returns the lines of the window ``offset`` columns in
+
+        Every line is exactly :attr:`width` cells, so printing a frame
+        on top of the last one leaves nothing behind.
+        """
+        offset %= self.period
+        return [row.window(offset, self.width) for row in self.rows]
+
+    def frames(self, step=1):
+        """Yields frames forever, scrolling ``step`` columns at a time"""
+        offset = 0
+        while True:
+            yield self.frame(offset)
+            offset += step
+
+    def play(self, stream=None, fps=20, step=1, count=None):
+        """Animates the marquee in place
+
+        :param stream: Where to write, defaults to :data:`sys.stdout`.
+        :param count:  How many frames to show, or None for forever.
+        """
+        stream = stream or sys.stdout
+        delay = 1.0 / fps
+        for n, lines in enumerate(self.frames(step)):
+            if count is not None and n >= count:
+                break
+            started = time.time()
+            if n:
+                stream.write("\x1b[%dF" % len(lines))
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+            time.sleep(max(0, delay - (time.time() - started)))
+
+
+class _Row(object):
+    """One row of a looping strip, indexed by column
+
+    The nth run has ``colors[n]`` and ``lengths[n]`` and starts at
+    column ``starts[n]``, and ``at[x]`` is the run that column ``x``
+    falls in, so no searching is needed to find it.  Escape codes
+    for each run's color are formatted up front too, so slicing a
+    window out only has to join strings.
+    """
+
+    def __init__(self, row, gap, width):
+        colors = array.array('H')
+        lengths = array.array('L')
+        total = 0
+        while total < width:
+            pairs = list(row) + [runs.TRANSPARENT, gap]
+            for n in range(0, len(pairs), 2):
+                (color, length) = (pairs[n], pairs[n + 1])
+                if not length:
+                    continue
+                if colors and colors[-1] == color:
+                    lengths[-1] += length
+                else:
+                    colors.append(color)
+                    lengths.append(length)
+                total += length
+        self.colors = colors
+        self.lengths = lengths
+        self.starts = array.array('L')
+        self.at = array.array('L')
+        for n, length in enumerate(lengths):
+            self.starts.append(len(self.at))
+            self.at.extend([n] * length)
+        self.codes = [None if color == runs.TRANSPARENT else
+                      "\x1b[48;5;%dm" % color for color in colors]
+
+    def window(self, left, width):
+        """Returns ``width`` cells starting at column ``left``"""
+        right = left + width
+        out = []
+        painted = False
+        n = self.at[left]
+        while left < right:
+            end = min(self.starts[n] + self.lengths[n], right)
+            code = self.codes[n]
+            if code is not None:
+                out.append(code)
+                painted = True
+            elif painted:
+                out.append("\x1b[49m")
+                painted = False
+            out.append(" " * (end - left))
+            left = end
+            n += 1
+        if painted:
+            out.append("\x1b[49m")
+        return "".join(out)
+
+
+def main():
+    """Scrolls the command line arguments across the terminal"""
+    import optparse
+    parser = optparse.OptionParser()
+    parser.add_option(
+        "-C", "--color", dest="color", default="#0099ff",
+        help=("Color of your text.  Default: %default"))
+    parser.add_option(
+        "-Z", "--size", dest="fsize", type="int", default=23,
+        help=("Size of font in points.  Default: %default"))
+    parser.add_option(
+        "-r", "--fps", dest="fps", type="float", default=20,
+        help=("Frames per second.  Default: %default"))
+    parser.add_option(
+        "-t", "--step", dest="step", type="int", default=2,
+        help=("Columns to scroll each frame.  Default: %default"))
+    (options, args) = parser.parse_args(args=sys.argv[1:])
+    ticker = Marquee(" ".join(args), color=options.color, fsize=options.fsize)
+    try:
+        ticker.play(fps=options.fps, step=options.step)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.pixmap
+    ~~~~~~~~~~~~~~~
+
+    The pixmap module reads uncompressed images without needing :mod:`PIL`.
+
+    Binary Netpbm files (PGM, PPM and PAM) and headerless raw RGB dumps are
+    memory mapped rather than decoded.  When :class:`fabulous.image.Image`
+    resizes one of these to fit your terminal, only the rows and columns that
+    survive the resize are ever read from disk, so rendering a huge frame
+    costs about as much as rendering a small one.
+
+    Netpbm files are picked up automatically by :mod:`fabulous.image`.  Raw
+    dumps don't have a header so you need to tell me their geometry::
+
+        from fabulous import image, pixmap
+        print image.Image(pixmap.open('frame.rgb', size=(640, 480)))
+
+"""
+
+import io
+import mmap
+import operator
+
+try:
+    basestring = basestring
+except NameError:
+    basestring = (str, bytes)
+
+
+MAGICS = (b'P5', b'P6', b'P7')
+WHITESPACE = b' \t\r\n\v\f'
+
+# PAM tuple types mapped to their depth.
+TUPLTYPES = {
+    'GRAYSCALE': 1,
+    'GRAYSCALE_ALPHA': 2,
+    'RGB': 3,
+    'RGB_ALPHA': 4,
+}
+
+
+class PixmapError(ValueError):
+    """I get raised when a file isn't a pixmap I know how to read
+
+    This class extends the standard :exc:`ValueError` exception so you
+    don't have to import me if you don't want to.
+    """
+
+
+def sniff(path):
+    """Returns true if ``path`` names a Netpbm file I can read
+
+    This only looks at the magic number, so it's cheap enough to call
+    before deciding whether or not :mod:`PIL` is needed.
+    """
+    if not isinstance(path, basestring):
+        return False
+    try:
+        with io.open(path, 'rb') as fp:
+            return fp.read(2) in MAGICS
+    except (IOError, OSError):
+        return False
+
+
+def open(path, size=None, depth=3, maxval=255, offset=0):
+    """Memory maps an uncompressed image file
+
+    If ``size`` is None, the file must be a binary Netpbm file and the
+    geometry is read from its header.  Otherwise the file is treated as
+    raw pixels, ``depth`` samples per pixel, starting at ``offset``.
+
+    :return: A :class:`MappedImage`.
+    """
+    return MappedImage(path, size, depth, maxval, offset)
+
+
+def _picker(indices):
+    """Returns a function that plucks ``indices`` out of a sequence
+
+    :func:`operator.itemgetter` does the plucking in C, but returns a
+    bare item rather than a tuple when there's only one index.
+    """
+    if len(indices) == 1:
+        (index,) = indices
+        return lambda seq: (seq[index],)
+    return operator.itemgetter(*indices)
+
+
+def _samples(count, total):
+    """Returns the source index for each of ``count`` resized pixels
+
+    Like :mod:`PIL`'s nearest neighbor filter, I sample from the
+    center of each destination pixel.
+    """
+    return [(2 * n + 1) * total // (2 * count) for n in range(count)]
+
+
+class Bitmap(object):
+    """An in-memory RGBA bitmap
+
+    I implement just enough of the :mod:`PIL` image interface to be
+    rendered by :class:`fabulous.image.Image`::
+
+        >>> bmp = Bitmap((2, 1), bytearray([255, 0, 0, 255, 0, 0, 0, 0]))
+        >>> bmp.getpixel((0, 0))
+        (255, 0, 0, 255)
+        >>> bmp.resize((4, 2)).getpixel((3, 1))
+        (0, 0, 0, 0)
+
+    """
+
+    mode = 'RGBA'
+
+    def __init__(self, size, data=None):
+        (width, height) = size
+        self.size = (width, height)
+        if data is None:
+            data = bytearray(width * height * 4)
+        if len(data) != width * height * 4:
+            raise PixmapError("Bitmap data doesn't match size %r" % (size,))
+        self.data = data
+
+    def load(self):
+        pass
+
+    def convert(self, mode):
+        if mode != self.mode:
+            raise PixmapError("Can't convert Bitmap to %r" % mode)
+        return self
+
+    def getpixel(self, xy):
+        (x, y) = xy
+        n = (y * self.size[0] + x) * 4
+        return tuple(self.data[n:n + 4])
+
+    def tobytes(self):
+        return bytes(self.data)
+
+    def row(self, y):
+        """Returns the RGBA bytes of row ``y``"""
+        stride = self.size[0] * 4
+        return self.data[y * stride:(y + 1) * stride]
+
+    def crop(self, box):
+        """Returns a copy of the ``(left, top, right, bottom)`` box"""
+        (left, top, right, bottom) = box
+        out = bytearray()
+        for y in range(top, bottom):
+            out.extend(self.row(y)[left * 4:right * 4])
+        return Bitmap((right - left, bottom - top), out)
+
+    def resize(self, size):
+        """Returns a copy resized with the nearest neighbor filter"""
+        (iw, ih) = self.size
+        (ow, oh) = size
+        pick = _picker([sx * 4 + c for sx in _samples(ow, iw)
+                        for c in range(4)])
+        out = bytearray()
+        for sy in _samples(oh, ih):
+            out.extend(bytearray(pick(self.row(sy))))
+        return Bitmap((ow, oh), out)
+
+
+class MappedImage(object):
+    """A memory mapped uncompressed image
+
+    I behave like a read-only :mod:`PIL` image in RGBA mode, except
+    :meth:`resize` returns a :class:`Bitmap`.  Grayscale pixels are
+    expanded to RGB and pixels without alpha are fully opaque.  Samples
+    with a ``maxval`` other than 255 are scaled to eight bits.
+    """
+
+    mode = 'RGBA'
+
+    def __init__(self, path, size=None, depth=3, maxval=255, offset=0):
+        self.path = path
+        self._fp = io.open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._fp.close()
+            raise PixmapError("Can't map %r (is it empty?)" % path)
+        try:
+            self._setup(size, depth, maxval, offset)
+        except (PixmapError, ValueError):
+            self.close()
+            raise
+
+    def _setup(self, size, depth, maxval, offset):
+        if size is None:
+            (size, depth, maxval, offset) = self._parse_header()
+        if depth not in (1, 2, 3, 4):
+            raise PixmapError("Unsupported depth %r" % depth)
+        if not 0 < maxval < 65536:
+            raise PixmapError("Unsupported maxval %r" % maxval)
+        self.size = tuple(size)
+        self.depth = depth
+        self.maxval = maxval
+        self.offset = offset
+        self.bytes_per_sample = 1 if maxval < 256 else 2
+        self.pixel_bytes = depth * self.bytes_per_sample
+        self.stride = self.size[0] * self.pixel_bytes
+        if offset + self.stride * self.size[1] > len(self._mm):
+            raise PixmapError("%r is truncated" % self.path)
+
+    def _parse_header(self):
+        mm = self._mm
+        magic = mm[:2]
+        if magic not in MAGICS:
+            raise PixmapError("%r is not a binary Netpbm file" % self.path)
+        if magic == b'P7':
+            return self._parse_pam()
+        pos = 2
+        values = []
+        while len(values) < 3:
+            pos = self._skip(pos)
+            end = pos
+            while end < len(mm) and mm[end:end + 1] not in WHITESPACE:
+                end += 1
+            values.append(int(mm[pos:end]))
+            pos = end
+        # exactly one whitespace character separates header from pixels
+        (width, height, maxval) = values
+        depth = 1 if magic == b'P5' else 3
+        return ((width, height), depth, maxval, pos + 1)
+
+    def _skip(self, pos):
+        """Skips whitespace and comments in a Netpbm header"""
+        mm = self._mm
+        while pos < len(mm):
+            char = mm[pos:pos + 1]
+            if char == b'#':
+                pos = mm.find(b'\n', pos)
+                if pos == -1:
+                    break
+            elif char not in WHITESPACE:
+                return pos
+            pos += 1
+        raise PixmapError("%r has a truncated header" % self.path)
+
+    def _parse_pam(self):
+        end = self._mm.find(b'ENDHDR\n')
+        if end == -1:
+            raise PixmapError("%r has no ENDHDR" % self.path)
+        fields = {}
+        for line in self._mm[3:end].decode('ascii').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                key, _, value = line.partition(' ')
+                fields[key] = value.strip()
+        try:
+            size = (int(fields['WIDTH']), int(fields['HEIGHT']))
+            depth = int(fields['DEPTH'])
+            maxval = int(fields['MAXVAL'])
+        except (KeyError, ValueError):
+            raise PixmapError("%r has an incomplete PAM header" % self.path)
+        tupltype = fields.get('TUPLTYPE')
+        if tupltype is not None and TUPLTYPES.get(tupltype) != depth:
+            raise PixmapError("Unsupported TUPLTYPE %r" % tupltype)
+        return (size, depth, maxval, end + len(b'ENDHDR\n'))
+
+    def close(self):
+        self._mm.close()
+        self._fp.close()
+
+    def load(self):
+        pass
+
+    def convert(self, mode):
+        if mode != self.mode:
+            raise PixmapError("Can't convert MappedImage to %r" % mode)
+        return self
+
+    def tobytes(self):
+        """Returns every pixel as RGBA bytes"""
+        return self.resize(self.size).tobytes()
+
+    def row(self, y):
+        """Returns the raw bytes of row ``y`` straight from the map"""
+        start = self.offset + y * self.stride
+        return bytearray(self._mm[start:start + self.stride])
+
+    def getpixel(self, xy):
+        (x, y) = xy
+        return tuple(self._rgba(self.row(y), [x]))
+
+    def crop(self, box):
+        """Copies the ``(left, top, right, bottom)`` box into a :class:`Bitmap`
+
+        Only the rows inside the box are read from the map.
+        """
+        (left, top, right, bottom) = box
+        columns = list(range(left, right))
+        out = bytearray()
+        for y in range(top, bottom):
+            out.extend(self._rgba(self.row(y), columns))
+        return Bitmap((right - left, bottom - top), out)
+
+    def resize(self, size):
+        """Resizes with the nearest neighbor filter into a :class:`Bitmap`
+
+        Only the sampled rows are copied out of the map, one at a time.
+        """
+        (iw, ih) = self.size
+        (ow, oh) = size
+        columns = _samples(ow, iw)
+        out = bytearray()
+        for sy in _samples(oh, ih):
+            out.extend(self._rgba(self.row(sy), columns))
+        return Bitmap((ow, oh), out)
+
+    def _channel(self, row, columns, sample):
+        """Returns eight bit values of one sample for each column"""
+        bps = self.bytes_per_sample
+        base = [sx * self.pixel_bytes + sample * bps for sx in columns]
+        if bps == 1:
+            values = bytearray(_picker(base)(row))
+            if self.maxval != 255:
+                values = bytearray(min(255, v * 255 // self.maxval)
+                                   for v in values)
+            return values
+        if self.maxval == 65535:
+            return bytearray(_picker(base)(row))  # big endian high byte
+        lows = _picker([n + 1 for n in base])(row)
+        return bytearray(min(255, ((hi << 8) | lo) * 255 // self.maxval)
+                         for hi, lo in zip(_picker(base)(row), lows))
+
+    def _rgba(self, row, columns):
+        """Converts ``columns`` of a raw row into RGBA bytes"""
+        out = bytearray(len(columns) * 4)
+        if self.depth in (1, 2):
+            gray = self._channel(row, columns, 0)
+            out[0::4] = out[1::4] = out[2::4] = gray
+        else:
+            for c in range(3):
+                out[c::4] = self._channel(row, columns, c)
+        if self.depth in (2, 4):
+            out[3::4] = self._channel(row, columns, self.depth - 1)
+        else:
+            out[3::4] = b'\xff' * len(columns)
+        return out
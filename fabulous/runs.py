@@ -0,0 +1,293 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.runs
+    ~~~~~~~~~~~~~
+
+    The runs module stores converted images in a compact run-length
+    encoded form.
+
+    Quantizing an image is the expensive part of printing it.  Once
+    :class:`fabulous.image.Image` has done that, it keeps the result as
+    :class:`Runs`, which can be turned into several flavors of output,
+    cropped, or saved to disk for later, without quantizing again::
+
+        img = image.Image("balls.png")
+        runs = img.runs()
+        print "\\n".join(runs.truecolor())
+        open("balls.runs", "wb").write(runs.dumps())
+
+"""
+
+import sys
+import array
+import struct
+import itertools
+
+from fabulous import xterm256
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+
+# color id used for runs of transparent pixels
+TRANSPARENT = 0xFFFF
+
+MAGIC = b'FRUN\x01'
+
+
+class Runs(object):
+    """Run-length encoded rows of xterm color ids
+
+    Each row is an ``array('H')`` of ``color, length`` pairs, where a
+    color of :data:`TRANSPARENT` means the pixels are see-through::
+
+        >>> runs = Runs.from_colors([196, 196, None, 'EOL', 21, 'EOL'])
+        >>> runs.rows
+        [array('H', [196, 2, 65535, 1]), array('H', [21, 1])]
+        >>> runs.size
+        (3, 2)
+        >>> runs.transparent
+        True
+        >>> list(runs.xterm256())
+        ['\\x1b[48;5;196m  \\x1b[49m', '\\x1b[48;5;21m \\x1b[49m']
+        >>> Runs.loads(runs.dumps()).rows == runs.rows
+        True
+
+    """
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    @classmethod
+    def from_colors(cls, colors):
+        """Creates runs from the output of :meth:`Image.convert`
+
+        :param colors: Iterable yielding an xterm color code for each
+                       pixel, None to indicate a transparent pixel, or
+                       ``'EOL'`` to indicate the end of a line.
+        """
+        return cls(iter_rows(colors))
+
+    @property
+    def size(self):
+        """Returns ``(width, height)`` in pixels"""
+        if not self.rows:
+            return (0, 0)
+        return (sum(self.rows[0][1::2]), len(self.rows))
+
+    @property
+    def transparent(self):
+        """Returns true if any pixel is transparent"""
+        return any(TRANSPARENT in row[0::2] for row in self.rows)
+
+    def crop(self, box):
+        """Returns runs for the ``(left, top, right, bottom)`` box"""
+        (left, top, right, bottom) = box
+        rows = []
+        for row in self.rows[top:bottom]:
+            out = array.array('H')
+            x = 0
+            for n in range(0, len(row), 2):
+                (color, length) = (row[n], row[n + 1])
+                start = max(x, left)
+                end = min(x + length, right)
+                if start < end:
+                    out.extend((color, end - start))
+                x += length
+            rows.append(out)
+        return Runs(rows)
+
+    def dumps(self):
+        """Serializes runs to bytes for caching"""
+        out = [MAGIC, struct.pack('<I', len(self.rows))]
+        for row in self.rows:
+            if sys.byteorder == 'big':
+                row = array.array('H', row)
+                row.byteswap()
+            out.append(struct.pack('<I', len(row)))
+            out.append(_tobytes(row))
+        return b''.join(out)
+
+    @classmethod
+    def loads(cls, data):
+        """Deserializes runs created by :meth:`dumps`"""
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not serialized runs")
+        pos = len(MAGIC)
+        (count,) = struct.unpack_from('<I', data, pos)
+        pos += 4
+        rows = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('<I', data, pos)
+            pos += 4
+            row = array.array('H')
+            _frombytes(row, data[pos:pos + length * 2])
+            if sys.byteorder == 'big':
+                row.byteswap()
+            pos += length * 2
+            rows.append(row)
+        return cls(rows)
+
+    def xterm256(self, pad=' '):
+        """Yields lines colored with 256-color escape codes
+
+        This is exactly what :class:`fabulous.image.Image` prints.
+        """
+        for row in self.rows:
+            yield xterm256_line(row, pad)
+
+    def truecolor(self, pad=' '):
+        """Yields lines colored with 24-bit escape codes
+
+        This is useful for terminals whose 256-color palette has been
+        customized.
+        """
+        for row in self.rows:
+            yield truecolor_line(row, pad)
+
+    def ech(self, minimum=8):
+        """Yields lines that paint long runs without printing spaces
+
+        Runs of at least ``minimum`` cells are drawn with the Erase
+        Character (``ECH``) sequence, which fills cells with the current
+        background color, followed by a cursor move.  This needs a
+        terminal with background color erase, which most have.
+        """
+        for row in self.rows:
+            yield ech_line(row, minimum)
+
+    def debug(self, pad=' '):
+        """Yields lines visualizing the runs
+
+        See :class:`fabulous.debug.DebugImage`.
+        """
+        for row in self.rows:
+            yield debug_line(row, pad)
+
+    def html(self, pad=' '):
+        """Returns the image as a ``<pre>`` block of HTML"""
+        lines = []
+        for row in self.rows:
+            line = []
+            for n in range(0, len(row), 2):
+                (color, length) = (row[n], row[n + 1])
+                text = escape(pad * length)
+                if color == TRANSPARENT:
+                    line.append(text)
+                else:
+                    line.append('<span style="background:#%02x%02x%02x">%s'
+                                '</span>' % (xterm256.xterm_to_rgb(color) +
+                                             (text,)))
+            lines.append("".join(line))
+        return '<pre style="line-height:1">%s</pre>' % "\n".join(lines)
+
+
+def iter_rows(colors):
+    """Yields an ``array('H')`` of runs for each line of colors"""
+    row = array.array('H')
+    for color, items in itertools.groupby(colors):
+        if color == "EOL":
+            for _ in items:
+                yield row
+                row = array.array('H')
+            continue
+        if color is None:
+            color = TRANSPARENT
+        length = sum(1 for _ in items)
+        while length > 0:
+            row.extend((color, min(length, 0xFFFF)))
+            length -= 0xFFFF
+
+
+def xterm256_line(row, pad=' '):
+    """Converts a row of runs into text with 256-color escape codes
+
+    Trailing transparent pixels are dropped.
+    """
+    return _line(row, pad, lambda color, text: "\x1b[48;5;%dm%s" % (
+        color, text))
+
+
+def truecolor_line(row, pad=' '):
+    """Converts a row of runs into text with 24-bit escape codes"""
+    return _line(row, pad, lambda color, text: "\x1b[48;2;%d;%d;%dm%s" % (
+        xterm256.xterm_to_rgb(color) + (text,)))
+
+
+def ech_line(row, minimum=8):
+    """Converts a row of runs into text, erasing long runs with ``ECH``"""
+    def paint(color, text):
+        if len(text) < minimum:
+            return "\x1b[48;5;%dm%s" % (color, text)
+        return "\x1b[48;5;%dm\x1b[%dX\x1b[%dC" % (color, len(text), len(text))
+    return _line(row, ' ', paint)
+
+
+def debug_line(row, pad=' '):
+    """Converts a row of runs into a visualization of the escape codes
+
+    ``<`` marks where a color starts, ``>`` where it's reset and ``T``
+    where transparency begins.
+    """
+    need_reset = False
+    line = ''
+    for n in range(0, len(row), 2):
+        (color, length) = (row[n], row[n + 1])
+        if color == TRANSPARENT:
+            if need_reset:
+                line = line[:-1] + ">"
+                need_reset = False
+            line += 'T' + (pad * length)[1:]
+        else:
+            need_reset = True
+            line += '<' + (pad * length)[1:]
+    if need_reset:
+        line = line[:-1] + ">"
+    return line.rstrip(' T')
+
+
+def _line(row, pad, paint):
+    """Converts a row of runs into text using ``paint(color, text)``"""
+    need_reset = False
+    line = []
+    for n in range(0, len(row), 2):
+        (color, length) = (row[n], row[n + 1])
+        if color == TRANSPARENT:
+            if need_reset:
+                line.append("\x1b[49m")
+                need_reset = False
+            line.append(pad * length)
+        else:
+            need_reset = True
+            line.append(paint(color, pad * length))
+    if need_reset:
+        line.append("\x1b[49m")
+    elif line:
+        line.pop()
+    return "".join(line)
+
+
+def _tobytes(row):
+    return row.tobytes() if hasattr(row, 'tobytes') else row.tostring()
+
+
+def _frombytes(row, data):
+    if hasattr(row, 'frombytes'):
+        row.frombytes(data)
+    else:
+        row.fromstring(data)
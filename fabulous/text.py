@@ -50,10 +50,16 @@
 from __future__ import print_function
 
 import os
+import re
 import sys
+import json
+import math
+import struct
+import tempfile
+import threading
+import collections
 
-from fabulous import utils, image, grapefruit
-from fabulous.compatibility import printy
+from fabulous import utils, image, runs, grapefruit
 
 try:
     unicode = unicode
@@ -105,31 +111,671 @@ class Text(image.Image):
     :param font:   The TrueType font you want.  If this is not an
                    absolute path, Fabulous will search for your font by
                    globbing the specified name in various directories.
+
+    :param wrap:   If true, break lines between words so they fit in
+                   the terminal, rather than shrinking the text.  Text
+                   can have newlines either way.  See :func:`layout`.
+
+    :param align:  How to line up lines of different widths: ``left``,
+                   ``center`` or ``right``.
+
+    :param fit:    If true, ignore ``fsize`` and pick the biggest font
+                   size that fills the terminal, then draw at exactly
+                   that size.  Normally text is drawn at ``fsize`` and
+                   resampled to fit, which blurs it.  See
+                   :func:`fit_font`.
+
+    :param supersample: With ``fit``, draw this many times bigger and
+                   average the pixels down, for smoother edges.
+
+    :param shrink: If false, text wider than the terminal is left that
+                   wide, for things like :class:`fabulous.marquee.Marquee`
+                   that only show part of it at a time.
     """
 
     def __init__(self, text, fsize=23, color="#0099ff", shadow=False,
-                 skew=None, font='NotoSans-Bold'):
+                 skew=None, font='NotoSans-Bold', wrap=False, align='left',
+                 fit=False, supersample=1, shrink=True):
         utils.pil_check()
-        from PIL import Image, ImageFont, ImageDraw
+        from PIL import Image, ImageDraw
         self.text = text
         self.color = grapefruit.Color.NewFromHtml(color)
-        self.font = ImageFont.truetype(resolve_font(font), fsize)
+        path = resolve_font(font)
+        self.font = fonts.get(path, fsize)
         skew = skew or 0
-        size = tuple([n + 3 + skew for n in self.font.getsize(self.text)])
+        scale = max(1, int(supersample)) if fit else 1
+        self._key = (text, path, fsize, self.color.html, bool(shadow), skew,
+                     bool(wrap), align, scale if fit else 0, bool(shrink),
+                     utils.term.width, utils.term.bgcolor.html)
+        self._entry = renders.get(self._key)
+        if self._entry is not None:
+            self.img = self._entry[0]
+            return
+        margin = 3 + skew
+        width = max(1, utils.term.width - margin)
+        (size, lines) = layout(self.font, self.text, width if wrap else None,
+                               align)
+        if fit:
+            text = u"\n".join(line for (_, _, line) in lines)
+            (self.font, size, lines) = fit_font(path, fsize, text,
+                                                width * scale, align)
+        size = (size[0] + margin * scale, size[1] + margin * scale)
+        if fit:
+            # whole cells, so shrinking them is a plain average
+            size = (-(-size[0] // scale) * scale,
+                    -(-size[1] // (2 * scale)) * 2 * scale)
         self.img = Image.new("RGBA", size, (0, 0, 0, 0))
         cvs = ImageDraw.Draw(self.img)
         if shadow:
-            cvs.text((2 + skew, 2), self.text,
+            for (x, y, line) in lines:
+                cvs.text((x + (2 + skew) * scale, y + 2 * scale), line,
+                         font=self.font,
+                         fill=(150, 150, 150, 150))
+        for (x, y, line) in lines:
+            cvs.text((x + (1 + skew) * scale, y + scale), line,
                      font=self.font,
-                     fill=(150, 150, 150, 150))
-        cvs.text((1 + skew, 1), self.text,
-                 font=self.font,
-                 fill=self.color.html)
+                     fill=self.color.html)
         if skew:
             self.img = self.img.transform(
-                size, Image.AFFINE, (1.0, 0.1 * skew, -1.0 * skew,
+                size, Image.AFFINE, (1.0, 0.1 * skew, -1.0 * skew * scale,
                                      0.0, 1.0, 0.0))
-        self.resize(None)
+        if fit:
+            self.img = _shrink(self.img, scale)
+        else:
+            self.resize(None if shrink else size[0])
+        (width, height) = self.img.size
+        self._entry = [self.img, None]
+        renders.put(self._key, self._entry, width * height * 4)
+
+    def __iter__(self):
+        """I yield the same lines as :class:`Image`, from :data:`renders`
+
+        Lines are only converted the first time a string is printed.
+        """
+        entry = self._entry
+        if entry is not None and entry[0] is self.img and entry[1]:
+            return iter(entry[1])
+        lines = list(image.Image.__iter__(self))
+        if entry is not None and entry[0] is self.img:
+            entry[1] = lines
+            renders.grow(self._key, sum(len(line) for line in lines))
+        return iter(lines)
+
+
+def render_many(items, workers=4):
+    """Renders lots of :class:`Text` at once, with a pool of threads
+
+    This is for things like a board of status labels::
+
+        labels = text.render_many([(host, {'color': 'red'})
+                                   for host in down], workers=8)
+
+    Every thread draws with the same :data:`fonts` and remembers what
+    it drew in the same :data:`renders`.  :mod:`PIL` lets go of the GIL
+    while it resizes and transforms bitmaps, so those parts run on as
+    many cores as you have workers.
+
+    :param items:   Iterable of ``(text, options)``, where ``options``
+                    is a dict of keyword arguments for :class:`Text`.
+                    Plain strings are fine too.
+    :param workers: How many threads to render with.
+
+    :return: A list with the lines of each item, in the same order.
+    """
+    items = [(item, {}) if isinstance(item, basestring) else item
+             for item in items]
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return [_render_lines(item) for item in items]
+    if workers <= 1 or len(items) <= 1:
+        return [_render_lines(item) for item in items]
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        return list(executor.map(_render_lines, items))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _render_lines(item):
+    (text, options) = item
+    return list(Text(text, **options))
+
+
+class AtlasText(image.Image):
+    """Renders TrueType text by pasting together pre-quantized glyphs
+
+    :class:`Text` draws, transforms and quantizes a whole bitmap every
+    time.  I look each character up in a :class:`GlyphAtlas`, where
+    it was drawn and quantized the first time it was needed, and copy
+    its cells into place.  That makes me a good fit for clocks,
+    counters and tickers, which print new strings all the time from a
+    handful of characters::
+
+        >>> clock = AtlasText("12:34", fsize=12)
+        >>> len(str(clock)) > 0
+        True
+
+    I don't shrink text to fit the terminal and don't do shadows or
+    skew.  Characters are placed on whole cells, spaced by their
+    advance widths plus kerning from the font.
+
+    :param text:  The text you want to display as a string.
+    :param fsize: The font size in points.
+    :param color: The color of your text, as you would in HTML/CSS.
+    :param font:  The TrueType font you want.  See :func:`resolve_font`.
+    """
+
+    def __init__(self, text, fsize=23, color="#0099ff",
+                 font='NotoSans-Bold'):
+        utils.pil_check()
+        self.text = text
+        self.atlas = get_atlas(font, fsize, color)
+        self._runs = (None, self.atlas.render(text))
+
+    @property
+    def size(self):
+        return self._runs[1].size
+
+    def __iter__(self):
+        for line in self._runs[1].xterm256(self.pad):
+            if line.strip():
+                yield line
+        yield ""
+
+    def runs(self):
+        return self._runs[1]
+
+
+class BitmapText(AtlasText):
+    """Renders text from a pre-built font pack, without :mod:`PIL`
+
+    Importing :mod:`PIL` takes longer than printing a banner, so for
+    plain text in the sizes you use, build a pack of your font once
+    (see :mod:`fabulous.fontpack`) and print with me instead::
+
+        print text.BitmapText("Deploying...", fsize=16)
+
+    I work like :class:`AtlasText`.  Characters that aren't in the pack
+    (which has printable ASCII by default) are printed as ``?``.
+
+    :raise fabulous.fontpack.PackError: If there's no pack for the
+                                        font at this size.
+    """
+
+    def __init__(self, text, fsize=23, color="#0099ff",
+                 font='NotoSans-Bold'):
+        self.text = text
+        self.pack = get_pack(font, fsize, color)
+        self._runs = (None, compose(self.pack, text))
+
+
+class EmojiText(AtlasText):
+    u"""Renders emoji from the sprite cache
+
+    :class:`Text` draws emoji at full size and shrinks them every time.
+    I paste together emoji that were drawn at cell resolution once and
+    saved by :class:`fabulous.fontpack.SpriteCache`, so marking every
+    row of a status page with the same emoji only draws it the first
+    time, in the first process that needed it::
+
+        >>> row = EmojiText(u"\u2705", fsize=12)
+        >>> len(str(row)) > 0
+        True
+
+    :param font: An emoji font.  Defaults to the bundled
+                 ``NotoEmoji-Regular``.
+    """
+
+    def __init__(self, text, fsize=23, color="#0099ff",
+                 font='NotoEmoji-Regular'):
+        self.text = text
+        self.sprites = get_sprites(font, fsize, color)
+        self._runs = (None, compose(self.sprites, text))
+
+
+class GlyphAtlas(object):
+    """Glyphs of one font, size and color, quantized to terminal cells
+
+    Each glyph is rasterized and quantized once, the first time it's
+    needed, and kept with its advance width.  The spacing of each pair
+    of characters is measured once too, so kerning comes from the same
+    layout engine :mod:`PIL` uses to draw strings.
+
+    :param font:  A :class:`PIL.ImageFont.FreeTypeFont`.
+    :param color: A :class:`fabulous.grapefruit.Color`.
+    """
+
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        (ascent, descent) = font.getmetrics()
+        self.height = ascent + descent
+        self.rows = self.height // 2
+        self.glyphs = {}
+        self._kerning = {}
+        self._lock = threading.Lock()
+
+    def glyph(self, char):
+        """Returns ``(offset, rows, advance)`` for a character
+
+        ``rows`` are lists of xterm color codes (None if transparent),
+        to be placed ``offset`` cells from the pen position.
+        ``advance`` is how many cells (not rounded) to move the pen.
+        """
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self._rasterize(char)
+            with self._lock:
+                glyph = self.glyphs.setdefault(char, glyph)
+        return glyph
+
+    def kerning(self, left, right):
+        """Returns how much to adjust the pen between two characters"""
+        pair = left + right
+        kern = self._kerning.get(pair)
+        if kern is None:
+            length = self.font.getlength
+            kern = length(pair) - length(left) - length(right)
+            self._kerning[pair] = kern
+        return kern
+
+    def render(self, text):
+        """Composes a string out of glyphs
+
+        :return: :class:`fabulous.runs.Runs` of the text.
+        """
+        return compose(self, text)
+
+    def _rasterize(self, char):
+        from PIL import Image, ImageDraw
+        (left, _, right, _) = self.font.getbbox(char)
+        offset = min(0, left)
+        width = max(1, right - offset)
+        img = Image.new("RGBA", (width, self.height), (0, 0, 0, 0))
+        ImageDraw.Draw(img).text((-offset, 0), char, font=self.font,
+                                 fill=self.color.html)
+        rows = [[]]
+        for color in image.Image(img, width).convert():
+            if color == "EOL":
+                rows.append([])
+            else:
+                rows[-1].append(color)
+        return (offset, rows[:-1], self.font.getlength(char))
+
+
+def compose(glyphs, text):
+    """Pastes pre-quantized glyphs together into a line of text
+
+    :param glyphs: Something like :class:`GlyphAtlas` with a ``rows``
+                   attribute, plus ``glyph(char)`` and ``kerning(left,
+                   right)`` methods.
+
+    :return: :class:`fabulous.runs.Runs` of the text.
+    """
+    placed = []
+    pen = 0.0
+    prev = None
+    for char in text:
+        if prev is not None:
+            pen += glyphs.kerning(prev, char)
+        (offset, rows, advance) = glyphs.glyph(char)
+        placed.append((int(round(pen)) + offset, rows))
+        pen += advance
+        prev = char
+    left = min([x for x, _ in placed] + [0])
+    width = max([x + len(rows[0]) for x, rows in placed if rows] +
+                [int(math.ceil(pen))]) - left
+    canvas = [[None] * width for _ in range(glyphs.rows)]
+    for (x, rows) in placed:
+        x -= left
+        for (line, row) in zip(canvas, rows):
+            for n, color in enumerate(row):
+                if color is not None:
+                    line[x + n] = color
+    return runs.Runs(runs.iter_rows(_with_eols(canvas)))
+
+
+def _with_eols(rows):
+    for row in rows:
+        for color in row:
+            yield color
+        yield "EOL"
+
+
+class FontPool(object):
+    """Thread-safe cache of loaded TrueType fonts
+
+    Loading a font means opening and parsing the whole file, so
+    :class:`Text` gets its fonts from the global :data:`fonts` pool
+    instead.  Fonts are keyed by ``(path, size, index)`` and the least
+    recently used ones are dropped once there are more than ``size``::
+
+        >>> pool = FontPool(size=2)
+        >>> path = resolve_font('NotoSans-Bold')
+        >>> pool.get(path, 10) is pool.get(path, 10)
+        True
+        >>> (pool.hits, pool.misses)
+        (1, 1)
+
+    :param size: Maximum number of fonts to keep loaded.
+    """
+
+    def __init__(self, size=32):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._fonts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fonts)
+
+    def get(self, path, fsize, index=0):
+        """Returns a :class:`PIL.ImageFont.FreeTypeFont`
+
+        :param path:  Absolute path of the font file.
+        :param fsize: The font size in points.
+        :param index: Which font to load from a collection file.
+        """
+        key = (path, fsize, index)
+        with self._lock:
+            font = self._fonts.pop(key, None)
+            if font is not None:
+                self.hits += 1
+                self._fonts[key] = font
+                return font
+            self.misses += 1
+        # parse outside the lock so other fonts can load meanwhile
+        from PIL import ImageFont
+        font = ImageFont.truetype(path, fsize, index=index)
+        with self._lock:
+            font = self._fonts.setdefault(key, font)
+            while len(self._fonts) > self.size:
+                self._fonts.popitem(last=False)
+        return font
+
+    def clear(self):
+        """Unloads every font and resets the counters"""
+        with self._lock:
+            self._fonts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+fonts = FontPool()
+
+
+class RenderCache(object):
+    """Thread-safe LRU cache bounded by how many bytes it holds
+
+    :class:`Text` remembers everything it renders in the global
+    :data:`renders` cache, keyed by the text, font, size, color,
+    effects, terminal width and background color.  Printing the same
+    banner again costs a dictionary lookup.  Set ``max_bytes`` to zero
+    to turn it off.
+
+    The cached bitmaps are shared between :class:`Text` objects, so
+    please don't draw on them.
+
+    :param max_bytes: Roughly how much memory to use for bitmaps and
+                      lines of text.
+    """
+
+    def __init__(self, max_bytes=8 << 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Returns the value for ``key``, or None"""
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items[key] = item
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        """Stores ``value``, which takes up ``nbytes`` of memory"""
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._items[key] = [value, nbytes]
+            self.bytes += nbytes
+            self._evict()
+
+    def grow(self, key, nbytes):
+        """Notes that the value for ``key`` got ``nbytes`` bigger"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                item[1] += nbytes
+                self.bytes += nbytes
+                self._evict()
+
+    def clear(self):
+        """Forgets everything and resets the counters"""
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._items:
+            (_, item) = self._items.popitem(last=False)
+            self.bytes -= item[1]
+
+
+renders = RenderCache()
+
+
+atlases = collections.OrderedDict()
+_atlases_lock = threading.Lock()
+
+
+def get_atlas(font, fsize, color):
+    """Returns the :class:`GlyphAtlas` for a font, size and color
+
+    The sixteen most recently used atlases are kept in :data:`atlases`.
+    Since glyphs are blended into the terminal background color, that's
+    part of the key as well.
+    """
+    path = resolve_font(font)
+    color = grapefruit.Color.NewFromHtml(color)
+    key = (path, fsize, color.html, utils.term.bgcolor.html)
+    with _atlases_lock:
+        atlas = atlases.pop(key, None)
+        if atlas is None:
+            atlas = GlyphAtlas(fonts.get(path, fsize), color)
+            while len(atlases) >= 16:
+                atlases.popitem(last=False)
+        atlases[key] = atlas
+    return atlas
+
+
+packs = collections.OrderedDict()
+
+
+def get_pack(font, fsize, color):
+    """Returns an open :class:`fabulous.fontpack.Pack`
+
+    The sixteen most recently used ones are kept open in :data:`packs`.
+    """
+    from fabulous import fontpack
+    key = (font, fsize, color, utils.term.bgcolor.html)
+    with _atlases_lock:
+        pack = packs.pop(key, None)
+        if pack is None:
+            pack = fontpack.Pack(fontpack.find(font, fsize), color)
+            while len(packs) >= 16:
+                packs.popitem(last=False)[1].close()
+        packs[key] = pack
+    return pack
+
+
+sprites = collections.OrderedDict()
+
+
+def get_sprites(font, fsize, color):
+    """Returns a :class:`fabulous.fontpack.SpriteCache`
+
+    The sixteen most recently used ones are kept open in
+    :data:`sprites`.
+    """
+    from fabulous import fontpack
+    key = (font, fsize, color, utils.term.bgcolor.html)
+    with _atlases_lock:
+        cache = sprites.pop(key, None)
+        if cache is None:
+            cache = fontpack.SpriteCache(font, fsize, color)
+            while len(sprites) >= 16:
+                sprites.popitem(last=False)[1].close()
+        sprites[key] = cache
+    return cache
+
+
+def get_font(name, fsize, index=0):
+    """Returns a loaded font from the :data:`fonts` pool
+
+    :param name: Font name or path, see :func:`resolve_font`.
+    """
+    return fonts.get(resolve_font(name), fsize, index)
+
+
+ALIGNMENTS = ('left', 'center', 'right')
+
+
+def layout(font, text, width=None, align='left'):
+    """Works out where to draw each line of a block of text
+
+    Lines are broken at newlines and, if ``width`` is given, between
+    words so no line is wider than ``width`` pixels.  A word that's
+    wider than that on its own gets a line to itself.  Each distinct
+    word is only measured once.  Lines are spaced by the height of the
+    font, so they share the same baselines no matter what's in them::
+
+        >>> font = get_font('NotoSans-Bold', 10)
+        >>> (size, lines) = layout(font, "hello there world", width=40,
+        ...                        align='right')
+        >>> [line for (x, y, line) in lines]
+        ['hello', 'there', 'world']
+        >>> [y for (x, y, line) in lines] == [0, sum(font.getmetrics()),
+        ...                                   2 * sum(font.getmetrics())]
+        True
+        >>> all(x + text_size(font, line)[0] == size[0]
+        ...     for (x, y, line) in lines)
+        True
+
+    :param font:  A :class:`PIL.ImageFont.FreeTypeFont`.
+    :param width: Most pixels a line can take up, or None to only break
+                  lines at newlines.
+    :param align: One of :data:`ALIGNMENTS`.  Lines are aligned within
+                  the widest one.
+
+    :return: ``((width, height), [(x, y, line), ...])``, which is the
+             size of the block and the position of each line.
+    """
+    if align not in ALIGNMENTS:
+        raise ValueError("align must be one of %r" % (ALIGNMENTS,))
+    measured = {}
+
+    def measure(word):
+        length = measured.get(word)
+        if length is None:
+            length = measured[word] = text_length(font, word)
+        return length
+
+    space = measure(u" ")
+    rows = []
+    for paragraph in text.split(u"\n"):
+        words = []
+        pen = 0.0
+        for word in paragraph.split(u" "):
+            length = measure(word)
+            if words and width is not None and pen + space + length > width:
+                rows.append(u" ".join(words))
+                words = []
+                pen = 0.0
+            if words:
+                pen += space
+            words.append(word)
+            pen += length
+        rows.append(u" ".join(words))
+    sizes = [text_size(font, row) for row in rows]
+    block = max(w for (w, _) in sizes)
+    height = sum(font.getmetrics())
+    lines = []
+    for n, (row, (w, _)) in enumerate(zip(rows, sizes)):
+        x = {'left': 0, 'center': (block - w) // 2, 'right': block - w}[align]
+        lines.append((x, n * height, row))
+    return ((block, height * (len(rows) - 1) + sizes[-1][1]), lines)
+
+
+def fit_font(path, fsize, text, width, align='left'):
+    """Finds the biggest font size that lays ``text`` out within ``width``
+
+    Advance widths grow in proportion to the font size, so the text is
+    measured at ``fsize`` to guess the answer, which hinting might make
+    a point or so too big::
+
+        >>> path = resolve_font('NotoSans-Bold')
+        >>> (font, size, lines) = fit_font(path, 10, "Fabulous", 120)
+        >>> size[0] <= 120 < text_size(get_font(path, font.size + 1),
+        ...                             "Fabulous")[0]
+        True
+
+    :return: ``(font, size, lines)``, where ``size`` and ``lines`` are
+             what :func:`layout` returns for the font.
+    """
+    (size, lines) = layout(fonts.get(path, fsize), text, None, align)
+    if not size[0]:
+        return (fonts.get(path, fsize), size, lines)
+    fsize = max(1, int(fsize * width / float(size[0])))
+    while True:
+        font = fonts.get(path, fsize)
+        (size, lines) = layout(font, text, None, align)
+        if size[0] <= width or fsize == 1:
+            return (font, size, lines)
+        fsize -= 1
+
+
+def _shrink(img, scale):
+    """Averages ``scale`` by ``2 * scale`` blocks of pixels into cells"""
+    if hasattr(img, 'reduce'):
+        return img.reduce((scale, 2 * scale))
+    from PIL import Image
+    (width, height) = img.size
+    return img.resize((width // scale, height // (2 * scale)), Image.BOX)
+
+
+def text_length(font, text):
+    """Returns how far the pen moves when ``text`` is drawn"""
+    if hasattr(font, 'getlength'):
+        return font.getlength(text)
+    return font.getsize(text)[0]
+
+
+def text_size(font, text):
+    """Returns ``(width, height)`` of the box ``text`` is drawn in
+
+    Like the ``getsize`` method :mod:`PIL` 10 removed from fonts, the box
+    starts at the drawing origin.
+    """
+    if hasattr(font, 'getsize'):
+        return font.getsize(text)
+    (_, _, right, bottom) = font.getbbox(text)
+    return (right, bottom)
 
 
 class FontNotFound(ValueError):
@@ -143,7 +789,9 @@ class FontNotFound(ValueError):
 def resolve_font(name):
     """Turns font names into absolute filenames
 
-    This is case sensitive. The extension should be omitted.
+    This is case sensitive. The extension should be omitted.  Fonts
+    can also be asked for by family and style, like ``"Noto Sans:bold"``
+    (see :func:`find_font`).
 
     For example::
 
@@ -173,7 +821,7 @@ def resolve_font(name):
     fonts = get_font_files()
     if name in fonts:
         return fonts[name]
-    raise FontNotFound("Can't find %r :'(  Try adding it to ~/.fonts" % name)
+    return find_font(name)
 
 font_roots = [
     '/usr/share/fonts/truetype',                # where ubuntu puts fonts
@@ -199,14 +847,315 @@ def get_font_files():
         >>> fonts['NotoSans-Bold'].endswith('/NotoSans-Bold.ttf')
         True
 
+    The answer is remembered for the life of the process, and saved in
+    an index file so other processes don't have to search either.  See
+    :func:`load_font_index`.
+    """
+    try:
+        path = os.path.join(utils.cache_dir(), 'fonts.json')
+    except OSError:
+        path = None
+    return load_font_index(font_roots, path)
+
+
+def load_font_index(roots, path=None):
+    """Returns ``{'FontName': '/abs/FontName.ttf', ...}`` for ``roots``
+
+    Searching thousands of font files is slow, so the result is saved
+    as JSON in ``path``, along with the modification time of every
+    directory that was searched.  Adding or removing a font changes
+    the time of its directory, so the index is only trusted if none of
+    them changed.  Checking that takes one ``stat`` per directory
+    rather than a listing of every file.
+
+    :param roots: Directories to search, in order.  Fonts found in
+                  later ones win.
+    :param path:  Where to keep the index, or None to not keep one.
+    """
+    roots = [os.path.abspath(root) for root in roots]
+    index = _read_font_index(path)
+    if (index is not None and index.get('version') == FONT_INDEX_VERSION
+            and index.get('roots') == roots
+            and all(_mtime(d) == t for d, t in index['dirs'].items())):
+        return index['fonts']
+    dirs = {}
+    fonts = {}
+    for root in roots:
+        _scan_fonts(root, dirs, fonts)
+    if path is not None:
+        _write_font_index(path, {'version': FONT_INDEX_VERSION,
+                                 'roots': roots, 'dirs': dirs,
+                                 'fonts': fonts})
+    return fonts
+
+
+FONT_INDEX_VERSION = 1
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _scan_fonts(path, dirs, fonts):
+    """Adds the fonts in ``path`` and its subdirectories to ``fonts``
+
+    Roots that don't exist are noted in ``dirs`` as well, so creating
+    them invalidates the index.
+    """
+    dirs[path] = _mtime(path)
+    try:
+        if hasattr(os, 'scandir'):
+            entries = [(e.name, e.path, e.is_dir(follow_symlinks=False))
+                       for e in os.scandir(path)]
+        else:
+            entries = [(name, os.path.join(path, name), None)
+                       for name in os.listdir(path)]
+    except OSError:
+        return
+    for (name, child, isdir) in entries:
+        if isdir is None:
+            isdir = os.path.isdir(child) and not os.path.islink(child)
+        if isdir:
+            _scan_fonts(child, dirs, fonts)
+        elif name.endswith(('.ttf', '.otf')):
+            fonts[name[:-4]] = child
+
+
+def _read_font_index(path):
+    if path is None:
+        return None
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_font_index(path, index):
+    """Saves the index atomically, or not at all"""
+    try:
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+    except (IOError, OSError):
+        return
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(index, fp)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def find_font(query):
+    """Finds a font by family and style, a bit like fontconfig
+
+    Queries look like ``"Family"`` or ``"Family:style"``, where style
+    is whatever you'd find in a font's subfamily name, such as
+    ``bold``, ``light italic`` or ``condensed semibold``, or a weight
+    like ``700``.  Case and spaces don't matter::
+
+        >>> find_font('Noto Sans:bold') == resolve_font('NotoSans-Bold')
+        True
+        >>> find_font('notosans:Bold') == resolve_font('NotoSans-Bold')
+        True
+
+    An exact match is a dictionary lookup.  Otherwise the closest face
+    in the family wins, preferring the same width and slant, then the
+    nearest weight.
+
+    The first query has to read the names out of every font file,
+    which is saved for next time.  See :func:`load_font_faces`.
+
+    :raise FontNotFound: If there's no such family.
     """
-    result = {}
-    for root in font_roots:
-        for path, dirs, names in os.walk(root):
-            for name in names:
-                if name.endswith(('.ttf', '.otf')):
-                    result[name[:-4]] = os.path.join(path, name)
-    return result
+    (family, _, style) = query.partition(':')
+    family = _family_key(family)
+    (exact, families) = _font_lookup()
+    (weight, italic, rest) = _parse_style(style)
+    path = exact.get((family, weight, italic, rest))
+    if path is not None:
+        return path
+    faces = families.get(family)
+    if not faces:
+        raise FontNotFound(
+            "Can't find %r :'(  Try adding it to ~/.fonts" % query)
+    return min(faces, key=lambda face: (
+        face[2] != rest, face[1] != italic, abs(face[0] - weight), face[3]))[3]
+
+
+@utils.memoize
+def get_font_faces():
+    """Returns ``{'/abs/Font.ttf': (family, style, weight), ...}``
+
+    This covers every font in :func:`get_font_files`, and is remembered
+    for the life of the process.
+    """
+    try:
+        path = os.path.join(utils.cache_dir(), 'faces.json')
+    except OSError:
+        path = None
+    return load_font_faces(get_font_files().values(), path)
+
+
+def load_font_faces(fonts, path=None):
+    """Returns the family, style and weight of each font file
+
+    Reading them means opening every font, so what's found is saved as
+    JSON in ``path``, along with the modification time and size of
+    each file.  Only new or changed fonts are read after that.  Files
+    that aren't fonts are left out.
+
+    :param fonts: Absolute paths of font files.
+    :param path:  Where to keep the results, or None to not keep them.
+    """
+    index = _read_font_index(path)
+    if index is None or index.get('version') != FONT_FACES_VERSION:
+        index = {'faces': {}}
+    old = index['faces']
+    faces = {}
+    for font in fonts:
+        try:
+            st = os.stat(font)
+        except OSError:
+            continue
+        entry = old.get(font)
+        if entry is None or entry[:2] != [st.st_mtime, st.st_size]:
+            try:
+                names = list(read_font_names(font))
+            except (IOError, OSError, ValueError, struct.error):
+                names = [None, None, None]
+            entry = [st.st_mtime, st.st_size] + names
+        faces[font] = entry
+    if path is not None and faces != old:
+        _write_font_index(path, {'version': FONT_FACES_VERSION,
+                                 'faces': faces})
+    return dict((font, tuple(entry[2:])) for (font, entry) in faces.items()
+                if entry[2] is not None)
+
+
+FONT_FACES_VERSION = 1
+
+
+def read_font_names(path):
+    """Reads ``(family, style, weight)`` out of a TrueType or OpenType font
+
+    Only the ``name`` table is read, plus the weight from the ``OS/2``
+    table if there is one.  For collections, this is the first font::
+
+        >>> read_font_names(resolve_font('NotoSans-Bold'))
+        ('Noto Sans', 'Bold', 700)
+
+    :raise ValueError: If it's not a font.
+    """
+    with open(path, 'rb') as fp:
+        (tag, count) = struct.unpack('>4sH', fp.read(6))
+        if tag == b'ttcf':
+            fp.seek(12)
+            (offset,) = struct.unpack('>I', fp.read(4))
+            fp.seek(offset)
+            (tag, count) = struct.unpack('>4sH', fp.read(6))
+            fp.seek(offset + 12)
+        else:
+            fp.seek(12)
+        if tag not in (b'\x00\x01\x00\x00', b'OTTO', b'true'):
+            raise ValueError("%r isn't a font" % path)
+        records = fp.read(16 * count)
+        tables = {}
+        for n in range(count):
+            (tag, _, offset, length) = struct.unpack_from('>4sIII', records,
+                                                          n * 16)
+            tables[tag] = (offset, length)
+        if b'name' not in tables:
+            raise ValueError("%r has no names" % path)
+        (offset, length) = tables[b'name']
+        fp.seek(offset)
+        data = fp.read(length)
+        weight = None
+        if b'OS/2' in tables:
+            fp.seek(tables[b'OS/2'][0] + 4)
+            (weight,) = struct.unpack('>H', fp.read(2))
+    (_, count, strings) = struct.unpack_from('>HHH', data)
+    names = {}
+    for n in range(count):
+        (platform, encoding, language, name_id, length,
+         offset) = struct.unpack_from('>6H', data, 6 + n * 12)
+        if name_id not in (1, 2, 16, 17):
+            continue
+        raw = data[strings + offset:strings + offset + length]
+        if platform in (0, 3):
+            rank = 0 if platform == 0 or language == 0x409 else 1
+            name = raw.decode('utf-16-be', 'replace')
+        elif platform == 1 and encoding == 0:
+            (rank, name) = (2, raw.decode('mac_roman', 'replace'))
+        else:
+            continue
+        if name_id not in names or rank < names[name_id][0]:
+            names[name_id] = (rank, name)
+    # the typographic names (16 and 17) group more styles per family
+    family = (names.get(16) or names.get(1) or (None, None))[1]
+    style = (names.get(17) or names.get(2) or (None, u'Regular'))[1]
+    if family is None:
+        raise ValueError("%r has no family name" % path)
+    return (family, style, weight or _parse_style(style)[0])
+
+
+# longest first, so "semibold" isn't taken for "bold"
+WEIGHTS = sorted([
+    ('thin', 100), ('hairline', 100), ('extralight', 200),
+    ('ultralight', 200), ('light', 300), ('regular', 400),
+    ('normal', 400), ('book', 400), ('roman', 400), ('medium', 500),
+    ('semibold', 600), ('demibold', 600), ('bold', 700),
+    ('extrabold', 800), ('ultrabold', 800), ('black', 900),
+    ('heavy', 900),
+], key=lambda item: -len(item[0]))
+
+
+def _parse_style(style):
+    """Turns a style name into ``(weight, italic, everything else)``"""
+    style = style.lower()
+    weight = 400
+    number = re.search(r'\d+', style)
+    if number:
+        weight = int(number.group())
+    style = re.sub(r'[^a-z]', '', style)
+    for (name, value) in WEIGHTS:
+        if name in style:
+            if not number:
+                weight = value
+            style = style.replace(name, '', 1)
+            break
+    italic = False
+    for name in ('italic', 'oblique'):
+        if name in style:
+            italic = True
+            style = style.replace(name, '', 1)
+    return (weight, italic, style)
+
+
+def _family_key(family):
+    return re.sub(r'[^a-z0-9]', '', family.lower())
+
+
+@utils.memoize
+def _font_lookup():
+    """Returns dicts to look fonts up by exact style, or by family"""
+    exact = {}
+    families = {}
+    for (path, (family, style, weight)) in get_font_faces().items():
+        (_, italic, rest) = _parse_style(style)
+        family = _family_key(family)
+        face = (weight, italic, rest, path)
+        families.setdefault(family, []).append(face)
+    for (family, faces) in families.items():
+        for (weight, italic, rest, path) in sorted(faces, key=lambda face:
+                                                   face[3]):
+            exact.setdefault((family, weight, italic, rest), path)
+    return (exact, families)
 
 
 def main():
@@ -242,21 +1191,56 @@ def main():
     parser.add_option(
         "-s", "--shadow", dest="shadow", action="store_true", default=False,
         help=("Size of font in points.  Default: %default"))
+    parser.add_option(
+        "-w", "--wrap", dest="wrap", action="store_true", default=False,
+        help=("Break lines between words to fit the terminal, instead of "
+              "shrinking the text.  Default: %default"))
+    parser.add_option(
+        "-a", "--align", dest="align", type="choice", choices=ALIGNMENTS,
+        default="left",
+        help=("Align lines to the left, center or right.  "
+              "Default: %default"))
+    parser.add_option(
+        "-f", "--fit", dest="fit", action="store_true", default=False,
+        help=("Pick the font size that fills the terminal, rather than "
+              "shrinking text drawn at --size.  Default: %default"))
+    parser.add_option(
+        "--supersample", dest="supersample", type="int", default=1,
+        help=("With --fit, draw this many times bigger and average down "
+              "for smoother edges.  Default: %default"))
+    parser.add_option(
+        "-b", "--bitmap", dest="bitmap", action="store_true", default=False,
+        help=("Print using a font pack built with --build-packs, which "
+              "is faster because it doesn't need PIL.  Default: %default"))
+    parser.add_option(
+        "--build-packs", dest="build_packs", action="store_true",
+        default=False,
+        help=("Pre-render --font at several sizes (and --size, if given) "
+              "for --bitmap."))
     (options, args) = parser.parse_args(args=sys.argv[1:])
     if options.list:
         print("\n".join(sorted(get_font_files())))
         return
+    if options.build_packs:
+        from fabulous import fontpack
+        sizes = sorted(set(fontpack.SIZES) | set([options.fsize]))
+        for path in fontpack.build(options.font, sizes):
+            print(path)
+        return
     if options.term_color:
         utils.term.bgcolor = options.term_color
     text = " ".join(args)
     if not isinstance(text, unicode):
         text = text.decode('utf-8')
+    if not options.bitmap:
+        Text(text, skew=options.skew, color=options.color, font=options.font,
+             fsize=options.fsize, shadow=options.shadow, wrap=options.wrap,
+             align=options.align, fit=options.fit,
+             supersample=options.supersample).write_to(sys.stdout)
+        return
     for line in text.split("\n"):
-        fab_text = Text(line, skew=options.skew, color=options.color,
-                        font=options.font, fsize=options.fsize,
-                        shadow=options.shadow)
-        for chunk in fab_text:
-            printy(chunk)
+        BitmapText(line, color=options.color, font=options.font,
+                   fsize=options.fsize).write_to(sys.stdout)
 
 
 if __name__ == '__main__':
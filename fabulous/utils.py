@@ -45,7 +45,23 @@ def memoize(function):
         result = function(*args)
         cache[args] = result
         return result
-    return function
+    return _memoize
+
+
+def cache_dir():
+    """Returns the directory Fabulous keeps its caches in
+
+    This is ``$XDG_CACHE_HOME/fabulous``, or ``~/.cache/fabulous``.
+    I'll create it if it doesn't exist yet.
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    path = os.path.join(root, 'fabulous')
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
 
 
 class TerminalInfo(object):
@@ -114,6 +130,24 @@ class TerminalInfo(object):
             height, width = struct.unpack("hhhh", call)[:2]
             return (width, height)
 
+    @property
+    def cell_size(self):
+        """Returns size of a character cell in pixels
+
+        Not every terminal reports its size in pixels.
+
+        :return: Returns ``(width, height)``.  If we can't tell, we'll
+                 just return ``(10, 20)``.
+        """
+        try:
+            call = fcntl.ioctl(self.termfd, termios.TIOCGWINSZ, b"\000" * 8)
+        except Exception:
+            return (10, 20)
+        (rows, cols, xpixel, ypixel) = struct.unpack("hhhh", call)
+        if not (rows and cols and xpixel and ypixel):
+            return (10, 20)
+        return (xpixel // cols, ypixel // rows)
+
     @property
     def width(self):
         """Returns width of terminal in characters
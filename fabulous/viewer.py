@@ -0,0 +1,403 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    fabulous.viewer
+    ~~~~~~~~~~~~~~~
+
+    The viewer module lets you zoom and pan around an image that's too
+    big to see all at once, without decoding it again for every size::
+
+        jart@compy:~$ fabulous-image --interactive huge.png
+        jart@compy:~$ python -m fabulous.viewer huge.png
+
+    Use the arrow keys (or ``hjkl``) to pan, ``+`` and ``-`` to zoom,
+    ``0`` to fit the whole image on screen, ``c`` to quit and print
+    what's on screen (a crop) and ``q`` to quit.
+
+"""
+
+from __future__ import division
+
+import os
+import sys
+import math
+import array
+import collections
+
+from fabulous import image, runs, utils
+
+
+# how far you can zoom in, as a power of two
+MAX_MAGNIFY = 3
+
+KEYS = {
+    b'\x1b[A': 'up', b'k': 'up',
+    b'\x1b[B': 'down', b'j': 'down',
+    b'\x1b[C': 'right', b'l': 'right',
+    b'\x1b[D': 'left', b'h': 'left',
+    b'+': 'in', b'=': 'in',
+    b'-': 'out', b'_': 'out',
+    b'0': 'fit',
+    b'c': 'crop',
+    b'q': 'quit', b'\x1b': 'quit',
+}
+
+
+class Pyramid(object):
+    """Power of two resolution pyramid of an image
+
+    Level ``n`` is the source shrunk by ``2 ** n``.  Each level is
+    made by halving the level above it the first time it's needed, and
+    is kept from then on, so zooming never decodes or shrinks the
+    source again::
+
+        >>> from fabulous import pixmap
+        >>> pyramid = Pyramid(pixmap.Bitmap((100, 30)))
+        >>> pyramid.level(2).size
+        (25, 7)
+        >>> len(pyramid.levels)
+        3
+
+    """
+
+    def __init__(self, img):
+        self.levels = [img]
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def level(self, n):
+        """Returns the source shrunk by ``2 ** n``"""
+        while len(self.levels) <= n:
+            (width, height) = self.levels[-1].size
+            self.levels.append(self.levels[-1].resize(
+                (max(1, width // 2), max(1, height // 2))))
+        return self.levels[n]
+
+
+class Viewer(object):
+    """Interactive image viewer with zoom and pan
+
+    At zoom level ``z``, each character cell covers ``2 ** z`` source
+    pixels across (and twice that down, like :class:`Image`).  Negative
+    levels magnify.  The picture at a zoom level is split into square
+    tiles of ``tile_size`` cells, which are quantized by
+    :class:`fabulous.image.Image` the first time they're visible and
+    kept as :class:`fabulous.runs.Runs` in an LRU cache of ``cache``
+    tiles.  So panning back and forth, or zooming out and back in,
+    costs almost nothing.
+
+    Panning only draws the rows and columns that scrolled into view.
+    The rest are moved by the terminal itself: rows with a scrolling
+    region and columns by deleting and inserting characters.
+
+    Everything but :meth:`run` returns escape codes rather than writing
+    them, so you can drive me however you like.
+
+    :param path: Image file name, or an already opened image.
+    :param size: ``(columns, rows)`` to view the image in.  Defaults to
+                 the terminal, minus a line for the status bar.
+    """
+
+    tile_size = 32
+    step = (8, 4)
+
+    def __init__(self, path, size=None, cache=256):
+        self.pyramid = Pyramid(image.load(path))
+        self.cache = cache
+        self.tiles = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.follow = size is None
+        if size is None:
+            size = (utils.term.width, utils.term.height - 1)
+        (self.width, self.height) = size
+        (self.x, self.y) = (0, 0)
+        self.fit()
+
+    @property
+    def max_zoom(self):
+        """Returns the zoom level at which the image is one cell"""
+        (iw, ih) = self.pyramid.size
+        return max((iw - 1).bit_length(), (ih - 1).bit_length() - 1, 0)
+
+    def canvas_size(self):
+        """Returns ``(columns, rows)`` of the whole image when zoomed"""
+        (iw, ih) = self.pyramid.size
+        return (_shrink(iw, self.zoom), _shrink(ih, self.zoom + 1))
+
+    def fit(self):
+        """Zooms to the closest level that fits the whole image
+
+        :return: Escape codes that redraw the screen.
+        """
+        self.zoom = -MAX_MAGNIFY
+        while self.zoom < self.max_zoom:
+            (columns, rows) = self.canvas_size()
+            if columns <= self.width and rows <= self.height:
+                break
+            self.zoom += 1
+        self._move(0, 0)
+        return self.draw()
+
+    def zoom_to(self, zoom):
+        """Zooms to level ``zoom``, keeping the center of the view put
+
+        :return: Escape codes that redraw the screen.
+        """
+        zoom = max(-MAX_MAGNIFY, min(self.max_zoom, zoom))
+        if zoom == self.zoom:
+            return ""
+        scale = 2.0 ** (self.zoom - zoom)
+        cx = (self.x + self.width / 2) * scale
+        cy = (self.y + self.height / 2) * scale
+        self.zoom = zoom
+        self._move(int(cx - self.width / 2), int(cy - self.height / 2))
+        return self.draw()
+
+    def resize(self, size):
+        """Changes the size of the view
+
+        :return: Escape codes that redraw the screen.
+        """
+        (self.width, self.height) = size
+        self._move(self.x, self.y)
+        return "\x1b[2J" + self.draw()
+
+    def pan(self, dx, dy):
+        """Moves the view by ``dx`` columns and ``dy`` rows
+
+        :return: Escape codes that update the screen.
+        """
+        (x, y) = (self.x, self.y)
+        self._move(x + dx, y + dy)
+        (dx, dy) = (self.x - x, self.y - y)
+        if not dx and not dy:
+            return ""
+        if abs(dx) >= self.width or abs(dy) >= self.height:
+            return self.draw()
+        out = []
+        if dy > 0:
+            out.append("\x1b[1;%dr\x1b[%dS\x1b[r" % (self.height, dy))
+            fresh = range(self.height - dy, self.height)
+        elif dy < 0:
+            out.append("\x1b[1;%dr\x1b[%dT\x1b[r" % (self.height, -dy))
+            fresh = range(-dy)
+        else:
+            fresh = range(0)
+        if dx:
+            for r in range(self.height):
+                if r not in fresh:
+                    out.append(self._shift(r, dx))
+        out.append(self._paint(fresh))
+        out.append(self.status())
+        return "".join(out)
+
+    def draw(self):
+        """Returns escape codes that redraw the whole screen"""
+        return self._paint(range(self.height)) + self.status()
+
+    def status(self):
+        """Returns escape codes that draw the status bar"""
+        if self.zoom >= 0:
+            zoom = "1:%d" % (1 << self.zoom)
+        else:
+            zoom = "%d:1" % (1 << -self.zoom)
+        (iw, ih) = self.pyramid.size
+        scale = 2.0 ** self.zoom
+        text = (" %s  %dx%d @ %d,%d  arrows pan  +/- zoom  0 fit  c crop"
+                "  q quit" % (zoom, iw, ih, self.x * scale,
+                              self.y * scale * 2))
+        return "\x1b[%d;1H\x1b[7m%s\x1b[0m\x1b[K" % (
+            self.height + 1, text[:self.width])
+
+    def crop(self):
+        """Returns lines of text of what's currently in view"""
+        (_, rows) = self.canvas_size()
+        return [runs.xterm256_line(self._row(y))
+                for y in range(self.y, min(rows, self.y + self.height))]
+
+    def handle(self, action):
+        """Performs an action from :data:`KEYS`
+
+        :return: Escape codes that update the screen.
+        """
+        (dx, dy) = self.step
+        if action == 'up':
+            return self.pan(0, -dy)
+        if action == 'down':
+            return self.pan(0, dy)
+        if action == 'left':
+            return self.pan(-dx, 0)
+        if action == 'right':
+            return self.pan(dx, 0)
+        if action == 'in':
+            return self.zoom_to(self.zoom - 1)
+        if action == 'out':
+            return self.zoom_to(self.zoom + 1)
+        if action == 'fit':
+            return self.fit()
+        return ""
+
+    def tile(self, tx, ty):
+        """Returns the rows of runs for a tile at the current zoom"""
+        key = (self.zoom, tx, ty)
+        rows = self.tiles.pop(key, None)
+        if rows is None:
+            self.misses += 1
+            rows = self._quantize(tx, ty)
+            while len(self.tiles) >= self.cache:
+                self.tiles.popitem(last=False)
+        else:
+            self.hits += 1
+        self.tiles[key] = rows
+        return rows
+
+    def run(self):
+        """Shows the image until you press ``q``
+
+        :return: Lines of text that were in view if you quit with
+                 ``c``, otherwise None.
+        """
+        import termios
+        import tty
+        fd = sys.stdin.fileno()
+        saved = termios.tcgetattr(fd)
+        crop = None
+        try:
+            tty.setcbreak(fd)
+            _write("\x1b[?1049h\x1b[?25l" + self.draw())
+            while True:
+                data = os.read(fd, 64)
+                if self.follow:
+                    size = (utils.term.width, utils.term.height - 1)
+                    if size != (self.width, self.height):
+                        _write(self.resize(size))
+                actions = [KEYS.get(key) for key in _keys(data)]
+                if 'crop' in actions:
+                    crop = self.crop()
+                    break
+                if 'quit' in actions or not data:
+                    break
+                _write("".join(self.handle(action) for action in actions))
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+            _write("\x1b[?25h\x1b[?1049l")
+        return crop
+
+    def _move(self, x, y):
+        """Moves the view, keeping as much of the image in it as I can"""
+        (columns, rows) = self.canvas_size()
+        self.x = max(0, min(x, columns - self.width))
+        self.y = max(0, min(y, rows - self.height))
+
+    def _paint(self, rows):
+        """Returns escape codes that draw rows of the screen"""
+        return "".join("\x1b[%d;1H%s\x1b[K" % (
+            r + 1, runs.xterm256_line(self._row(self.y + r))) for r in rows)
+
+    def _shift(self, r, dx):
+        """Returns escape codes that scroll row ``r`` sideways
+
+        The cells that are still in view are moved by the terminal and
+        only the ones that just came into view are drawn.
+        """
+        if dx > 0:
+            right = self.x + self.width
+            row = self._row(self.y + r, right - dx, right)
+            return "\x1b[%d;1H\x1b[%dP\x1b[%d;%dH%s" % (
+                r + 1, dx, r + 1, self.width - dx + 1,
+                runs.xterm256_line(row))
+        row = self._row(self.y + r, self.x, self.x - dx)
+        return "\x1b[%d;1H\x1b[%d@%s" % (
+            r + 1, -dx, runs.xterm256_line(row))
+
+    def _row(self, y, left=None, right=None):
+        """Returns runs for columns ``[left, right)`` of canvas row ``y``
+        """
+        if left is None:
+            (left, right) = (self.x, self.x + self.width)
+        (columns, rows) = self.canvas_size()
+        right = min(right, columns)
+        out = array.array('H')
+        if y >= rows:
+            return out
+        size = self.tile_size
+        (ty, dy) = divmod(y, size)
+        for tx in range(left // size, (right - 1) // size + 1):
+            start = tx * size
+            tile = runs.Runs([self.tile(tx, ty)[dy]])
+            piece = tile.crop((max(left, start) - start, 0,
+                               right - start, 1)).rows[0]
+            if out and piece and out[-2] == piece[0]:
+                # same color on both sides of the seam
+                out[-1] += piece[1]
+                piece = piece[2:]
+            out.extend(piece)
+        return out
+
+    def _quantize(self, tx, ty):
+        """Converts one tile of the image into rows of runs"""
+        level = max(0, self.zoom)
+        src = self.pyramid.level(level)
+        (sw, sh) = src.size
+        (columns, rows) = self.canvas_size()
+        size = self.tile_size
+        (left, top) = (tx * size, ty * size)
+        (width, height) = (min(size, columns - left), min(size, rows - top))
+        # source pixels per cell at this level, cells are twice as tall
+        scale = 2.0 ** (self.zoom - level)
+        x0 = min(sw - 1, int(left * scale))
+        y0 = min(sh - 1, int(2 * top * scale))
+        x1 = max(x0 + 1, min(sw, int(math.ceil((left + width) * scale))))
+        y1 = max(y0 + 1, min(sh, int(math.ceil(2 * (top + height) * scale))))
+        piece = src.crop((x0, y0, x1, y1)).resize((width, height * 2))
+        return image.Image(piece, width).runs().rows
+
+
+def _shrink(n, power):
+    """Returns ``n / 2 ** power`` rounded up"""
+    if power < 0:
+        return n << -power
+    return max(1, -(-n >> power))
+
+
+def _keys(data):
+    """Splits bytes read from the keyboard into keys"""
+    n = 0
+    while n < len(data):
+        if data[n:n + 2] == b'\x1b[':
+            yield data[n:n + 3]
+            n += 3
+        else:
+            yield data[n:n + 1]
+            n += 1
+
+
+def _write(text):
+    image.write_pieces(sys.stdout, [text])
+
+
+def main():
+    """Main function for :command:`python -m fabulous.viewer`"""
+    for imgpath in sys.argv[1:]:
+        lines = Viewer(imgpath).run()
+        if lines:
+            image.write_pieces(sys.stdout, (line + "\n" for line in lines))
+
+
+if __name__ == '__main__':
+    main()
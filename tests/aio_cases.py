@@ -0,0 +1,88 @@
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for :mod:`fabulous.aio`, imported by aio_test.py
+
+Older Pythons can't even parse this file, so aio_test.py only imports
+it where ``async def`` works.
+"""
+
+import os
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+
+from fabulous import image
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'a.ppm')
+        data = bytearray()
+        for y in range(40):
+            for x in range(20):
+                data.extend((x * 12, y * 6, 0))
+        with open(self.path, 'wb') as fp:
+            fp.write(b'P6 20 40 255\n' + bytes(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_render(self):
+        expected = str(image.Image(self.path, width=20))
+
+        async def render():
+            img = await image.Image.open_async(self.path, width=20)
+            return await img.render_async()
+        self.assertEqual(self.run_async(render()), expected)
+
+    def test_aiter(self):
+        img = image.Image(self.path, width=20)
+        expected = list(image.Image(self.path, width=20))
+        threads = set()
+        convert = img.convert
+
+        def spy():
+            threads.add(threading.current_thread())
+            for color in convert():
+                yield color
+        img.convert = spy
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def collect():
+            task = asyncio.ensure_future(ticker())
+            lines = [line async for line in img.aiter(batch=2)]
+            task.cancel()
+            return lines
+        self.assertEqual(self.run_async(collect()), expected)
+        self.assertTrue(threading.main_thread() not in threads)
+        # other coroutines ran between batches
+        self.assertTrue(len(ticks) >= len(expected) // 2)
+
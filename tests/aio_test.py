@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+
+if sys.version_info >= (3, 7):
+    # the tests use async syntax, so they live where older Pythons
+    # won't try to compile them
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from aio_cases import TestAsync
+else:
+    @unittest.skip("requires Python 3.7")
+    class TestAsync(unittest.TestCase):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
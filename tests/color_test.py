@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fabulous import color
+from fabulous.color import bold, red, blue, plain, fg256, bg256
+
+
+class custom(color.ColorString):
+    fmt = "<%s>"
+
+
+class loud(bold):
+    pass
+
+
+class TestRender(unittest.TestCase):
+
+    def test_minimal(self):
+        self.assertEqual(str(bold(red("a"), red("b"))),
+                         "\x1b[1;31mab\x1b[22;39m")
+        self.assertEqual(str(red("a", bold("b"), "c")),
+                         "\x1b[31ma\x1b[1mb\x1b[22mc\x1b[39m")
+        self.assertEqual(str(fg256("red", bg256("blue", "x"))),
+                         "\x1b[38;5;196;48;5;21mx\x1b[39;49m")
+
+    def test_inner_style_restores_outer(self):
+        self.assertEqual(str(red("a", blue("b"), "c")),
+                         "\x1b[31ma\x1b[34mb\x1b[31mc\x1b[39m")
+        self.assertEqual(str(bold(bold("a"), "b")), "\x1b[1mab\x1b[22m")
+
+    def test_spans(self):
+        spans = plain("a", red("b", "c"), "d").spans()
+        self.assertEqual(spans, [({}, "a"), ({'fg': '31'}, "b"),
+                                 ({'fg': '31'}, "c"), ({}, "d")])
+        self.assertTrue(spans[1][0] is spans[2][0])
+        self.assertEqual(red("").spans(), [])
+
+    def test_opaque(self):
+        self.assertEqual(str(red("a", custom(blue("b")), "c")),
+                         "\x1b[31ma<\x1b[34mb\x1b[39m>\x1b[31mc\x1b[39m")
+        self.assertEqual(str(custom("x")), "<x>")
+        self.assertEqual(str(loud("x")), "\x1b[1mx\x1b[22m")
+
+    def test_sep(self):
+        class commas(plain):
+            sep = ", "
+        self.assertEqual(str(commas("a", red("b"), "c")),
+                         "a, \x1b[31mb\x1b[39m, c")
+
+    def test_deep(self):
+        cs = plain()
+        for _ in range(5000):
+            cs = red(cs, "a")
+        self.assertEqual(str(cs), "\x1b[31m" + "a" * 5000 + "\x1b[39m")
+
+
+class TestConcat(unittest.TestCase):
+
+    def test_add_nests(self):
+        a = red("a")
+        cs = a + "b"
+        self.assertEqual(cs.items, (a, "b"))
+        self.assertEqual(("x" + cs).items, ("x", cs))
+        self.assertRaises(TypeError, lambda: cs + 1)
+        self.assertRaises(TypeError, lambda: 1 + cs)
+
+    def test_add_loop(self):
+        cs = plain()
+        for _ in range(5000):
+            cs += red("a")
+            cs += ", "
+        self.assertEqual(len(cs), 15000)
+        self.assertEqual(str(cs), "\x1b[31ma\x1b[39m, " * 5000)
+
+    def test_join_flat(self):
+        cs = plain("-").join([red("a") + "b" + "c", blue("d"),
+                              plain("e", "f")])
+        self.assertEqual(len(cs.items), 4)
+        self.assertEqual(cs.items[1], "bc-")
+        self.assertEqual(cs.items[3], "-ef")
+
+    def test_styled_and_sep_kept(self):
+        class commas(plain):
+            sep = ", "
+        cs = plain().join([bold("a"), commas("b", "c")])
+        self.assertEqual(str(cs), "\x1b[1ma\x1b[22mb, c")
+        self.assertEqual(len(cs.items), 2)
+
+    def test_join(self):
+        fields = [red(str(n)) for n in range(10000)]
+        line = plain(" ").join(fields)
+        self.assertEqual(len(line.items), 19999)
+        self.assertFalse(any(isinstance(item, plain) for item in line.items))
+        self.assertEqual(str(line).count("\x1b[31m"), 10000)
+        self.assertEqual(len(line), len(" ".join(map(str, range(10000)))))
+        self.assertTrue(plain(",").join([fields[0]]) is fields[0])
+        self.assertEqual(plain(",").join([]), None)
+        self.assertEqual(str(plain("-").join(["a", "b"])), "a-b")
+        self.assertRaises(TypeError, plain(",").join, ["a", 1])
+        self.assertRaises(TypeError, plain(",").join, [1, "a"])
+        self.assertEqual(plain(",").join([1]), 1)
+
+
+class TestLen(unittest.TestCase):
+
+    def test_len(self):
+        self.assertEqual(len(bold("hello ", red("world"))), 11)
+        self.assertEqual(len(plain(b"ab")), len(str(b"ab")))
+        self.assertEqual(len(red("")), 0)
+
+    @unittest.skipUnless(color.wcwidth, "requires wcwidth")
+    def test_wide(self):
+        wcswidth = color.wcwidth.wcswidth
+        for text in [u"hello", u"\u4f60\u597d", u"caf\u00e9",
+                     u"a\u0301", u"\u2764\ufe0f", u"\U0001f468\u200d"
+                     u"\U0001f469", u"tab\there", u"\U0001f603!"]:
+            self.assertEqual(color._text_width(text), wcswidth(text))
+
+    def test_cached(self):
+        calls = []
+        width = color._text_width
+
+        def counting(text):
+            calls.append(text)
+            return width(text)
+        cell = red("a", bold("bc"))
+        color._text_width = counting
+        try:
+            self.assertEqual((len(cell), len(cell)), (3, 3))
+            self.assertEqual(calls, ["a", "bc"])
+            row = plain(cell, " ", cell)
+            self.assertEqual(len(row), 7)
+            self.assertEqual(calls, ["a", "bc", " "])
+            cell.items = ("abcd",)
+            self.assertEqual(len(cell), 4)
+        finally:
+            color._text_width = width
+
+    def test_deep(self):
+        cs = plain()
+        for _ in range(5000):
+            cs = red(cs, "a")
+        self.assertEqual(len(cs), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
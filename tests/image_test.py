@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import re
+import zlib
+import base64
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+
+from fabulous import image
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+class Trickle(io.RawIOBase):
+    """Unbuffered stream that only takes a few bytes per write"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += bytes(data[:7])
+        return min(7, len(data))
+
+
+class TestImage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, name, size, pixel):
+        """Saves an image whose pixels are ``pixel(x, y)`` as PPM or PIL"""
+        path = os.path.join(self.tmp, name)
+        (width, height) = size
+        data = bytearray()
+        for y in range(height):
+            for x in range(width):
+                data.extend(pixel(x, y))
+        if name.endswith('.ppm'):
+            with open(path, 'wb') as fp:
+                fp.write(b'P6 ' + str(width).encode() + b' ' +
+                         str(height).encode() + b' 255\n' + bytes(data))
+        else:
+            from PIL import Image
+            Image.frombytes('RGB', size, bytes(data)).save(path)
+        return path
+
+    def test_braille(self):
+        halves = lambda x, y: (255, 255, 255) if x < 2 else (0, 0, 0)
+        path = self.save('a.ppm', (4, 8), halves)
+        lines = list(image.BrailleImage(path, width=2))
+        self.assertEqual(lines, [u'\x1b[38;5;231m\u28ff\x1b[39m'] * 2 + [''])
+        diagonal = lambda x, y: (255, 255, 0) if x == y // 2 else (0, 0, 0)
+        path = self.save('b.ppm', (4, 8), diagonal)
+        lines = list(image.BrailleImage(path, width=2))
+        self.assertEqual(lines[0], u'\x1b[38;5;226m\u28a3\x1b[39m')
+        self.assertEqual(lines[1], u' \x1b[38;5;226m\u28a3\x1b[39m')
+        band = lambda x, y: (0, 0, 0) if 8 <= y < 16 else (255, 255, 255)
+        path = self.save('c.ppm', (8, 24), band)
+        lines = list(image.BrailleImage(path, width=4))
+        white = u'\x1b[38;5;231m' + u'\u28ff' * 4 + u'\x1b[39m'
+        self.assertEqual(lines, [white, white, u'', u'', white, white, u''])
+
+    def test_write_to(self):
+        checkers = lambda x, y: (255, 255, 255) if (x + y) % 2 else (0, 0, 0)
+        path = self.save('a.ppm', (50, 100), checkers)
+        img = image.Image(path, width=50)
+        expected = "".join(line + "\n" for line in img).encode('utf-8')
+        out = io.BytesIO()
+        img.write_to(out, chunk_size=100)
+        self.assertEqual(out.getvalue(), expected)
+        text = io.StringIO()
+        img.write_to(text, chunk_size=100)
+        self.assertEqual(text.getvalue(), expected.decode('utf-8'))
+        raw = Trickle()
+        img.write_to(raw, chunk_size=100)
+        self.assertEqual(bytes(raw.data), expected)
+        (rfd, wfd) = os.pipe()
+        try:
+            img.write_to(wfd)
+            os.close(wfd)
+            with os.fdopen(rfd, 'rb') as fp:
+                self.assertEqual(fp.read(), expected)
+        finally:
+            for fd in (rfd, wfd):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def kitty(self, medium):
+        """Returns the keys and payload of a 2x2 kitty image"""
+        corners = lambda x, y: (x * 255, y * 255, 7)
+        path = self.save('a.ppm', (2, 2), corners)
+        img = image.KittyImage(path, width=1, medium=medium)
+        lines = list(img)
+        self.assertEqual(lines[1:], [''])
+        keys = {}
+        payload = ''
+        for match in re.finditer('\x1b_G([^;]*);([^\x1b]*)\x1b\\\\', lines[0]):
+            keys.update(kv.split('=') for kv in match.group(1).split(','))
+            payload += match.group(2)
+        self.assertEqual(keys['f'], '32')
+        self.assertEqual((keys['s'], keys['v'], keys['c']), ('2', '2', '1'))
+        return (keys, base64.b64decode(payload))
+
+    pixels = bytes(bytearray([0, 0, 7, 255, 255, 0, 7, 255,
+                              0, 255, 7, 255, 255, 255, 7, 255]))
+
+    def test_kitty_direct(self):
+        (keys, payload) = self.kitty('direct')
+        self.assertEqual((keys['t'], keys['o'], keys['m']), ('d', 'z', '0'))
+        self.assertEqual(zlib.decompress(payload), self.pixels)
+
+    def test_kitty_file(self):
+        (keys, payload) = self.kitty('file')
+        self.assertEqual(keys['t'], 't')
+        path = payload.decode('utf-8')
+        self.assertTrue('tty-graphics-protocol' in path)
+        with open(path, 'rb') as fp:
+            self.assertEqual(fp.read(), self.pixels)
+        os.unlink(path)
+
+    def test_kitty_once(self):
+        path = self.save('a.ppm', (2, 2), lambda x, y: (0, 0, 0))
+        img = image.KittyImage(path, width=1, medium='file')
+        self.assertEqual(str(img), str(img))
+        self.assertTrue(os.path.exists(img.name))
+        name = img.name
+        img.close()
+        self.assertFalse(os.path.exists(name))
+        img.close()
+
+    @unittest.skipUnless(image._shm_usable(), "requires shared memory")
+    def test_kitty_shm(self):
+        from multiprocessing import shared_memory
+        (keys, payload) = self.kitty('shm')
+        self.assertEqual((keys['t'], keys['S']), ('s', '16'))
+        shm = shared_memory.SharedMemory(payload.decode('utf-8').lstrip('/'))
+        try:
+            self.assertEqual(bytes(shm.buf[:16]), self.pixels)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_sixel(self):
+        red = lambda x, y: (255, 0, 0)
+        path = self.save('a.ppm', (2, 2), red)
+        img = image.SixelImage(path, width=1, cell_size=(10, 20))
+        self.assertEqual(list(img), [
+            '\x1bP0;1q"1;1;10;10#196;2;100;0;0!10~-#196!10N\x1b\\', ''])
+        out = io.BytesIO()
+        img.write_to(out)
+        self.assertEqual(out.getvalue(), str(img).encode('ascii'))
+        corner = lambda x, y: (0, 0, 255) if x == y == 0 else (0, 0, 0)
+        path = self.save('b.ppm', (12, 12), corner)
+        img = image.SixelImage(path, width=1, cell_size=(12, 24))
+        self.assertEqual(str(img).split('-')[:2], [
+            '\x1bP0;1q"1;1;12;12#21;2;0;0;100@$#16;2;0;0;0}!11~',
+            '#16!12~\x1b\\\n'])
+
+    def test_grid(self):
+        paths = [self.save('a.ppm', (2, 2), lambda x, y: (255, 0, 0)),
+                 os.path.join(self.tmp, 'missing.png'),
+                 self.save('b.ppm', (2, 2), lambda x, y: (0, 0, 255)),
+                 self.save('c.ppm', (4, 2), lambda x, y: (0, 255, 0))]
+        lines = list(image.grid(paths, width=5, thumb_width=2, gap=1))
+        self.assertEqual(lines, [
+            '\x1b[48;5;196m  \x1b[49m \x1b[48;5;21m  \x1b[49m',
+            'a. b.',
+            '\x1b[48;5;46m  \x1b[49m',
+            'c.',
+        ])
+
+    def test_grid_bounded(self):
+        path = self.save('a.ppm', (2, 2), lambda x, y: (255, 0, 0))
+        taken = []
+
+        def paths():
+            for n in range(1000):
+                taken.append(n)
+                yield path
+        lines = image.grid(paths(), width=2, thumb_width=2, workers=2)
+        self.assertEqual(next(lines), '\x1b[48;5;196m  \x1b[49m')
+        lines.close()
+        self.assertTrue(len(taken) <= 8)
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_grid_bomb(self):
+        from PIL import Image
+        big = self.save('big.png', (64, 64), lambda x, y: (0, 0, 255))
+        small = self.save('small.ppm', (2, 2), lambda x, y: (255, 0, 0))
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 1000
+        try:
+            lines = list(image.grid([big, small], width=8, thumb_width=2))
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+        self.assertEqual(lines, ['\x1b[48;5;196m  \x1b[49m', 'sm'])
+
+    @unittest.skipUnless(hasattr(signal, 'SIGWINCH'), "requires SIGWINCH")
+    def test_live(self):
+        path = self.save('a.ppm', (8, 8), lambda x, y: (x * 30, 0, 0))
+        live = image.LiveImage(path, debounce=0.05)
+        widths = [4]
+        live.fit = lambda: widths[0]
+        self.assertTrue(live.stale())
+        first = live.current()
+        self.assertEqual(first.size, (4, 2))
+        self.assertFalse(live.stale())
+        widths[0] = 6
+        self.assertFalse(live.stale())  # no SIGWINCH yet
+        os.kill(os.getpid(), signal.SIGWINCH)
+        self.assertFalse(live.stale())  # still debouncing
+        time.sleep(0.1)
+        self.assertTrue(live.stale())
+        self.assertTrue(live.stale())  # until current() is called
+        self.assertEqual(live.current().size, (6, 3))
+        self.assertFalse(live.stale())
+        widths[0] = 4
+        os.kill(os.getpid(), signal.SIGWINCH)
+        time.sleep(0.1)
+        self.assertTrue(live.stale())
+        self.assertTrue(live.current() is first)
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_tiled(self):
+        stripes = lambda x, y: (255, 0, 0) if y < 32 else (0, 0, 255)
+        for name in ('a.bmp', 'a.tif'):
+            path = self.save(name, (64, 64), stripes)
+            lines = list(image.TiledImage(path, width=8, strip_height=8))
+            red = '\x1b[48;5;196m        \x1b[49m'
+            blue = '\x1b[48;5;21m        \x1b[49m'
+            self.assertEqual(lines, [red, red, blue, blue, ''])
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_tiled_compressed(self):
+        stripes = lambda x, y: (255, 0, 0) if y < 32 else (0, 0, 255)
+        path = self.save('a.tif', (64, 64), stripes)
+        from PIL import Image
+        Image.open(path).save(path, compression='tiff_deflate')
+        self.assertEqual(list(image.TiledImage(path, width=8)),
+                         list(image.Image(path, width=8)))
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_tiled_bomb(self):
+        from PIL import Image
+        stripes = lambda x, y: (255, 0, 0) if y < 32 else (0, 0, 255)
+        bmp = self.save('a.bmp', (64, 64), stripes)
+        png = self.save('a.png', (64, 64), stripes)
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 1000
+        try:
+            self.assertRaises(Image.DecompressionBombError, Image.open, bmp)
+            lines = list(image.TiledImage(bmp, width=8, strip_height=8))
+            self.assertEqual(len(lines), 5)
+            self.assertEqual(Image.MAX_IMAGE_PIXELS, 1000)
+            # formats decoded in one go are still protected
+            self.assertRaises(Image.DecompressionBombError,
+                              image.TiledImage, png, width=8)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import re
+import unittest
+
+from fabulous import marquee, runs, utils
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+def cells(line):
+    """Returns the background color of each cell in a line"""
+    out = []
+    color = None
+    for m in re.finditer(r'\x1b\[(?:48;5;(\d+)|49)m|( )', line):
+        if m.group(2):
+            out.append(color)
+        else:
+            color = m.group(1) and int(m.group(1))
+    return out
+
+
+class NarrowTerm(utils.TerminalInfo):
+
+    dimensions = (20, 10)
+
+
+class TestMarquee(unittest.TestCase):
+
+    def setUp(self):
+        colors = []
+        for y in range(3):
+            for x in range(11):
+                colors.append(None if (x + y) % 4 == 0 else 16 + x * 3 + y)
+            colors.append('EOL')
+        self.strip = runs.Runs.from_colors(colors)
+        self.pixels = [colors[n:n + 11] for n in range(0, len(colors), 12)]
+
+    def test_frames(self):
+        ticker = marquee.Marquee(self.strip, width=7, gap=3)
+        self.assertEqual(ticker.period, 14)
+        looped = [row + [None] * 3 for row in self.pixels]
+        for offset in range(40):
+            frame = ticker.frame(offset)
+            self.assertEqual(len(frame), 3)
+            for (line, row) in zip(frame, looped):
+                want = [row[(offset + x) % 14] for x in range(7)]
+                self.assertEqual(cells(line), want)
+                self.assertTrue(line.endswith(' ') or
+                                line.endswith('\x1b[49m'))
+
+    def test_wider_than_strip(self):
+        ticker = marquee.Marquee(self.strip, width=40, gap=0)
+        self.assertEqual(cells(ticker.frame(5)[0]),
+                         [self.pixels[0][(5 + x) % 11] for x in range(40)])
+
+    def test_play(self):
+        stream = io.StringIO()
+        ticker = marquee.Marquee(self.strip, width=5, gap=1)
+        ticker.play(stream, fps=1000, count=3)
+        self.assertEqual(stream.getvalue().count('\x1b[3F'), 2)
+
+    def test_nothing(self):
+        self.assertRaises(ValueError, marquee.Marquee, runs.Runs(), gap=0,
+                          width=5)
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_text(self):
+        term = utils.term
+        utils.term = NarrowTerm()
+        try:
+            ticker = marquee.Marquee("Hello world", fsize=12)
+        finally:
+            utils.term = term
+        self.assertEqual(ticker.width, 20)
+        self.assertTrue(ticker.period > 20 + 8)
+        self.assertEqual(len(cells(ticker.frame(3)[0])), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
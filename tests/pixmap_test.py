@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fabulous import image, pixmap
+
+
+def write(path, data):
+    with open(path, 'wb') as fp:
+        fp.write(data)
+
+
+class TestPixmap(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # 4x2 image: red, green, blue, white / black x4
+        self.rgb = bytearray([255, 0, 0, 0, 255, 0, 0, 0, 255, 255, 255, 255]
+                             + [0] * 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name, data):
+        path = os.path.join(self.tmp, name)
+        write(path, data)
+        return path
+
+    def test_ppm(self):
+        path = self.path('a.ppm', b'P6\n# comment\n4 2\n255\n' +
+                         bytes(self.rgb))
+        self.assertTrue(pixmap.sniff(path))
+        img = pixmap.open(path)
+        self.assertEqual(img.size, (4, 2))
+        self.assertEqual(img.getpixel((1, 0)), (0, 255, 0, 255))
+        self.assertEqual(img.getpixel((3, 1)), (0, 0, 0, 255))
+        small = img.resize((2, 2))
+        self.assertEqual(small.size, (2, 2))
+        self.assertEqual(small.getpixel((0, 0)), (0, 255, 0, 255))
+        self.assertEqual(small.getpixel((1, 0)), (255, 255, 255, 255))
+        img.close()
+
+    def test_crop(self):
+        path = self.path('a.ppm', b'P6 4 2 255\n' + bytes(self.rgb))
+        img = pixmap.open(path)
+        box = img.crop((1, 0, 3, 2))
+        self.assertEqual(box.size, (2, 2))
+        self.assertEqual(box.getpixel((1, 0)), (0, 0, 255, 255))
+        self.assertEqual(box.crop((1, 0, 2, 1)).tobytes(), b'\0\0\xff\xff')
+        img.close()
+
+    def test_pgm_16bit(self):
+        path = self.path('a.pgm', b'P5 2 1 65535\n\x80\x00\xff\xff')
+        img = pixmap.open(path)
+        self.assertEqual(img.getpixel((0, 0)), (128, 128, 128, 255))
+        self.assertEqual(img.getpixel((1, 0)), (255, 255, 255, 255))
+
+    def test_pgm_maxval(self):
+        path = self.path('a.pgm', b'P5 2 1 15\n\x00\x0f')
+        img = pixmap.open(path)
+        self.assertEqual(img.getpixel((1, 0)), (255, 255, 255, 255))
+
+    def test_pam_alpha(self):
+        header = (b'P7\nWIDTH 1\nHEIGHT 1\nDEPTH 4\nMAXVAL 255\n'
+                  b'TUPLTYPE RGB_ALPHA\nENDHDR\n')
+        path = self.path('a.pam', header + b'\x01\x02\x03\x00')
+        self.assertEqual(pixmap.open(path).getpixel((0, 0)), (1, 2, 3, 0))
+
+    def test_raw(self):
+        path = self.path('a.rgb', bytes(self.rgb))
+        self.assertFalse(pixmap.sniff(path))
+        img = pixmap.open(path, size=(4, 2))
+        self.assertEqual(img.getpixel((2, 0)), (0, 0, 255, 255))
+        self.assertRaises(pixmap.PixmapError, pixmap.open, path, (4, 3))
+
+    def test_not_netpbm(self):
+        path = self.path('a.txt', b'hello there')
+        self.assertRaises(pixmap.PixmapError, pixmap.open, path)
+
+    def test_image(self):
+        # two rows per character, so the second row gets sampled
+        self.rgb = self.rgb[12:] + self.rgb[:12]
+        path = self.path('a.ppm', b'P6 4 2 255\n' + bytes(self.rgb))
+        lines = list(image.Image(path, width=4))
+        self.assertEqual(lines[0], '\x1b[48;5;196m \x1b[48;5;46m '
+                                   '\x1b[48;5;21m \x1b[48;5;231m \x1b[49m')
+        raw = pixmap.open(self.path('a.rgb', bytes(self.rgb)), size=(4, 2))
+        self.assertEqual(list(image.Image(raw, width=4)), lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
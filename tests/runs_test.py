@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from fabulous import image, pixmap, runs
+
+
+class TestRuns(unittest.TestCase):
+
+    def setUp(self):
+        # 12 blue pixels, 2 transparent, 2 red
+        row = ([0, 0, 255, 255] * 12 + [0, 0, 0, 0] * 2 +
+               [255, 0, 0, 255] * 2)
+        bmp = pixmap.Bitmap((16, 2), bytearray(row * 2))
+        self.img = image.Image(bmp, width=16)
+        self.runs = runs.Runs.from_colors(
+            [21] * 12 + [None] * 2 + [196] * 2 + ['EOL'])
+
+    def test_image_runs(self):
+        self.assertEqual(self.img.runs().rows, self.runs.rows)
+
+    def test_cached(self):
+        lines = list(self.img)
+        calls = []
+
+        def convert():
+            calls.append(1)
+            yield "EOL"
+        self.img.convert = convert
+        self.assertEqual(list(self.img), lines)
+        self.assertEqual(self.img.runs().rows, self.runs.rows)
+        self.assertEqual(calls, [])
+
+    def test_reduce_ignores_cache(self):
+        str(self.img)
+        self.assertEqual(list(self.img.reduce([21, 21, 'EOL'])),
+                         ['\x1b[48;5;21m  \x1b[49m'])
+
+    def test_no_runs(self):
+        for cls in (image.BrailleImage, image.KittyImage, image.SixelImage):
+            img = cls(pixmap.Bitmap((2, 2)), width=1)
+            self.assertRaises(TypeError, img.runs)
+
+    def test_crop(self):
+        cropped = self.runs.crop((10, 0, 15, 1))
+        self.assertEqual(list(cropped.rows[0]),
+                         [21, 2, runs.TRANSPARENT, 2, 196, 1])
+        self.assertEqual(cropped.size, (5, 1))
+
+    def test_truecolor(self):
+        self.assertEqual(list(self.runs.truecolor()), [
+            '\x1b[48;2;0;0;255m' + ' ' * 12 + '\x1b[49m  '
+            '\x1b[48;2;255;0;0m  \x1b[49m'])
+
+    def test_ech(self):
+        self.assertEqual(list(self.runs.ech()), [
+            '\x1b[48;5;21m\x1b[12X\x1b[12C\x1b[49m  '
+            '\x1b[48;5;196m  \x1b[49m'])
+
+    def test_html(self):
+        self.assertEqual(self.runs.html('#'), (
+            '<pre style="line-height:1">'
+            '<span style="background:#0000ff">############</span>##'
+            '<span style="background:#ff0000">##</span></pre>'))
+
+    def test_serialize(self):
+        data = self.runs.dumps()
+        self.assertEqual(runs.Runs.loads(data).rows, self.runs.rows)
+        self.assertRaises(ValueError, runs.Runs.loads, b'nope' + data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+from fabulous import fontpack, runs, text, utils
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+class FixedTerm(utils.TerminalInfo):
+    """Terminal that's always 79x40, even when there's no TTY"""
+
+    dimensions = (79, 40)
+
+
+@unittest.skipUnless(PIL, "requires PIL")
+class TestText(unittest.TestCase):
+
+    def setUp(self):
+        self.term = utils.term
+        utils.term = FixedTerm()
+
+    def tearDown(self):
+        utils.term = self.term
+
+    def test_text(self):
+        lines = list(text.Text("hi", fsize=10))
+        self.assertTrue(len(lines) > 2)
+        self.assertTrue(all(len(line) for line in lines[:-1]))
+
+    def test_pool(self):
+        pool = text.FontPool(size=2)
+        path = text.resolve_font('NotoSans-Bold')
+        first = pool.get(path, 10)
+        self.assertTrue(pool.get(path, 10) is first)
+        pool.get(path, 11)
+        pool.get(path, 12)
+        self.assertEqual(len(pool), 2)
+        self.assertFalse(pool.get(path, 10) is first)
+        self.assertEqual((pool.hits, pool.misses), (1, 4))
+
+    def test_pool_threads(self):
+        pool = text.FontPool()
+        path = text.resolve_font('NotoSans-Bold')
+        got = []
+
+        def worker():
+            for _ in range(20):
+                got.append(pool.get(path, 14))
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.hits + pool.misses, 80)
+        self.assertEqual(len(set(map(id, got))), 1)
+
+    def test_text_uses_pool(self):
+        text.fonts.clear()
+        text.Text("a", fsize=9)
+        text.Text("b", fsize=9)
+        self.assertEqual((text.fonts.hits, text.fonts.misses), (1, 1))
+
+    def test_render_cache(self):
+        text.renders.clear()
+        first = text.Text("hi", fsize=10)
+        lines = list(first)
+        again = text.Text("hi", fsize=10)
+        self.assertTrue(again.img is first.img)
+        self.assertEqual(list(again), lines)
+        self.assertEqual((text.renders.hits, text.renders.misses), (1, 1))
+        self.assertTrue(text.Text("hi", fsize=10, shadow=True).img
+                        is not first.img)
+        utils.term.dimensions = (10, 40)
+        self.assertTrue(text.Text("hi", fsize=10).img is not first.img)
+        self.assertEqual(len(text.renders), 3)
+
+    def test_layout(self):
+        font = text.get_font('NotoSans-Bold', 10)
+        measured = []
+
+        class Counting(object):
+            getmetrics = font.getmetrics
+            getbbox = font.getbbox
+
+            def getlength(self, word):
+                measured.append(word)
+                return font.getlength(word)
+
+        words = "the cat and the dog and the bird"
+        (size, lines) = text.layout(Counting(), words + "\n\nok", 30)
+        self.assertEqual(sorted(measured),
+                         sorted(set(words.split()) | set([" ", "", "ok"])))
+        self.assertTrue(all(text.text_size(font, line)[0] <= 30
+                            for (_, _, line) in lines))
+        self.assertEqual(" ".join(line for (_, _, line) in lines[:-2]), words)
+        self.assertEqual(lines[-2][2], "")
+        height = sum(font.getmetrics())
+        self.assertEqual([y for (_, y, _) in lines],
+                         [n * height for n in range(len(lines))])
+        self.assertEqual(text.layout(font, "hi there")[1],
+                         [(0, 0, "hi there")])
+        (size, lines) = text.layout(font, "a\nwide line", align='center')
+        self.assertEqual(lines[0][0], (size[0] - text.text_size(font, "a")[0])
+                         // 2)
+        self.assertRaises(ValueError, text.layout, font, "a", None, 'middle')
+
+    def test_wrap(self):
+        words = "lorem ipsum dolor sit amet"
+        shrunk = text.Text(words, fsize=20)
+        wrapped = text.Text(words, fsize=20, wrap=True)
+        self.assertEqual(shrunk.size[0], 79)
+        self.assertTrue(wrapped.size[0] <= 79)
+        self.assertTrue(wrapped.size[1] > shrunk.size[1] * 2)
+        self.assertTrue(text.Text(words, fsize=20, wrap=True,
+                                  align='right').img is not wrapped.img)
+
+    def test_fit(self):
+        fitted = text.Text("Fab", fsize=10, fit=True)
+        self.assertTrue(70 <= fitted.size[0] <= 79)
+        self.assertTrue(fitted.font.size > 10)
+        smooth = text.Text("Fab", fsize=10, fit=True, supersample=3)
+        self.assertTrue(70 <= smooth.size[0] <= 79)
+        self.assertTrue(smooth.img is not fitted.img)
+        self.assertTrue(len(list(smooth)) > 2)
+        wrapped = text.Text("Fab ulous", fsize=60, fit=True, wrap=True)
+        self.assertTrue(wrapped.size[0] <= 79)
+        self.assertTrue(wrapped.size[1] > fitted.size[1])
+        (font, size, lines) = text.fit_font(
+            text.resolve_font('NotoSans-Bold'), 23, "", 50)
+        self.assertEqual((font.size, size[0]), (23, 0))
+
+    def test_render_many(self):
+        text.renders.clear()
+        items = [("a%d" % (n % 5), {'fsize': 8 + n % 3}) for n in range(20)]
+        got = text.render_many(items + ["plain"], workers=4)
+        self.assertEqual(len(got), 21)
+        for ((words, options), lines) in zip(items, got):
+            self.assertEqual(lines, list(text.Text(words, **options)))
+        self.assertEqual(got[-1], list(text.Text("plain")))
+        self.assertTrue(len(text.renders) <= 16)
+        self.assertEqual(text.render_many([]), [])
+
+    def test_render_cache_bytes(self):
+        cache = text.RenderCache(max_bytes=100)
+        cache.put('a', 1, 60)
+        cache.put('b', 2, 30)
+        self.assertEqual(cache.get('a'), 1)
+        cache.grow('b', 20)
+        self.assertEqual((cache.get('a'), cache.get('b')), (1, None))
+        cache.put('c', 3, 50)
+        self.assertEqual((cache.get('a'), cache.bytes), (None, 50))
+        cache.put('d', 4, 500)
+        self.assertEqual((len(cache), cache.bytes), (0, 0))
+
+    def test_atlas(self):
+        clock = text.AtlasText("10:01", fsize=12)
+        lines = list(clock)
+        self.assertTrue(len(lines) > 2)
+        atlas = clock.atlas
+        self.assertEqual(sorted(atlas.glyphs), ['0', '1', ':'])
+        rasterized = []
+        atlas._rasterize = rasterized.append
+        again = text.AtlasText("01:10", fsize=12)
+        self.assertTrue(again.atlas is atlas)
+        self.assertEqual(rasterized, [])
+        self.assertEqual(again.size, clock.size)
+
+    def test_atlas_kerning(self):
+        atlas = text.get_atlas('NotoSans-Bold', 10, '#fff')
+        atlas.rows = 2
+        atlas.glyphs = {'a': (0, [[1, 1], [1, None]], 2.0),
+                        'b': (0, [[2], [None]], 1.0)}
+        atlas._kerning = {'ab': -1.0, 'bb': 0.0, 'ba': 0.0}
+        self.assertEqual(atlas.render('ab').rows,
+                         runs.Runs.from_colors([1, 2, 'EOL',
+                                                1, None, 'EOL']).rows)
+        self.assertEqual(atlas.render('bab').size, (3, 2))
+        text.atlases.clear()
+
+
+@unittest.skipUnless(PIL, "requires PIL")
+class TestFontPack(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+        self.term = utils.term
+        utils.term = FixedTerm()
+        (self.path,) = fontpack.build(sizes=[12], chars=u'?ab 1')
+
+    def tearDown(self):
+        if self.cache is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.cache
+        utils.term = self.term
+        for pack in text.packs.values():
+            pack.close()
+        text.packs.clear()
+        shutil.rmtree(self.tmp)
+
+    def test_pack(self):
+        self.assertEqual(fontpack.find('NotoSans-Bold', 12), self.path)
+        self.assertRaises(fontpack.PackError, fontpack.find,
+                          'NotoSans-Bold', 13)
+        pack = fontpack.Pack(self.path)
+        self.assertTrue('a' in pack)
+        self.assertFalse('c' in pack)
+        self.assertEqual(pack.glyph('c'), pack.glyph('?'))
+        atlas = text.get_atlas('NotoSans-Bold', 12, '#0099ff')
+        self.assertEqual(pack.rows, atlas.rows)
+        for char in u'ab 1':
+            self.assertEqual(pack.glyph(char)[0], atlas.glyph(char)[0])
+            self.assertAlmostEqual(pack.glyph(char)[2], atlas.glyph(char)[2],
+                                   places=1)
+        pack.close()
+
+    def test_bitmap_text(self):
+        banner = text.BitmapText(u'ab 1', fsize=12)
+        self.assertEqual(banner.size,
+                         text.AtlasText(u'ab 1', fsize=12).size)
+        self.assertTrue(len(list(banner)) > 2)
+        self.assertTrue(text.BitmapText(u'ba', fsize=12).pack is banner.pack)
+
+    def test_no_pil(self):
+        script = ("import sys; from fabulous import text; "
+                  "print(len(str(text.BitmapText('ab', fsize=12))) > 0, "
+                  "'PIL' in sys.modules)")
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(
+            os.path.dirname(os.path.abspath(text.__file__))))
+        out = subprocess.check_output([sys.executable, '-c', script],
+                                      env=env)
+        self.assertEqual(out.split(), [b'True', b'False'])
+
+
+@unittest.skipUnless(PIL, "requires PIL")
+class TestSpriteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.term = utils.term
+        utils.term = FixedTerm()
+
+    def tearDown(self):
+        utils.term = self.term
+        shutil.rmtree(self.tmp)
+
+    def test_persist(self):
+        first = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        smile = first.glyph(u"\U0001f603")
+        self.assertEqual(len(smile[1]), first.rows)
+        self.assertTrue(first.glyph(u"\U0001f603") is smile)
+        second = fontpack.SpriteCache(fsize=12, directory=self.tmp,
+                                      color="#ff0000")
+        self.assertTrue(u"\U0001f603" in second)
+        self.assertEqual(second._face, None)
+        self.assertEqual(second.glyph(u"\U0001f603")[::2], smile[::2])
+        first.glyph(u"\u2705")
+        self.assertFalse(u"\u2705" in second)
+        second.glyph(u"\u2705")
+        self.assertEqual(second._face, None)
+        self.assertEqual(len(fontpack.SpriteCache(fsize=12,
+                                                  directory=self.tmp)._index),
+                         2)
+        first.close()
+        second.close()
+
+    def test_corrupt(self):
+        cache = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        cache.glyph(u"a")
+        cache.glyph(u"b")
+        cache.close()
+        with open(cache.path, 'r+b') as fp:
+            fp.seek(-1, 2)
+            fp.write(b'\x01')
+        cache = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        self.assertEqual(list(cache._index), [ord(u"a")])
+        cache.glyph(u"c")
+        cache.close()
+        cache = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        self.assertEqual(sorted(cache._index), [ord(u"a"), ord(u"c")])
+        cache.close()
+
+    def test_replaced(self):
+        first = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        (a, b) = (first.glyph(u"a"), first.glyph(u"b"))
+        other = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        self.assertEqual(sorted(other._index), [ord(u"a"), ord(u"b")])
+        with open(first.path, 'r+b') as fp:
+            fp.seek(-1, 2)
+            fp.write(b'\x01')
+        fixer = fontpack.SpriteCache(fsize=12, directory=self.tmp)
+        fixer.glyph(u"W")
+        # the file was started over with "W" where "b" used to be, and
+        # missing "W" makes the other cache map the new file
+        self.assertEqual(other.glyph(u"W"), fixer.glyph(u"W"))
+        self.assertEqual(sorted(other._index), sorted(map(ord, u"aW")))
+        self.assertEqual(other.glyph(u"b"), b)
+        self.assertEqual(other.glyph(u"a"), a)
+        self.assertEqual(
+            sorted(fontpack.SpriteCache(fsize=12, directory=self.tmp)._index),
+            sorted(map(ord, u"abW")))
+        for cache in (first, other, fixer):
+            cache.close()
+
+    def test_emoji_text(self):
+        cache = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+        try:
+            row = text.EmojiText(u"\u2705\u2705", fsize=12)
+            self.assertEqual(row.size[1], row.sprites.rows)
+            self.assertTrue(len(list(row)) > 2)
+        finally:
+            if cache is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = cache
+            for sprite_cache in text.sprites.values():
+                sprite_cache.close()
+            text.sprites.clear()
+
+
+class TestFontIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roots = [os.path.join(self.tmp, 'a'), os.path.join(self.tmp, 'b')]
+        self.index = os.path.join(self.tmp, 'fonts.json')
+        self.touch('a/Foo.ttf')
+        self.touch('a/sub/Bar.otf')
+        self.touch('a/readme.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def touch(self, name):
+        path = os.path.join(self.tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        # make sure directory times change, even on coarse filesystems
+        stamp = time.time() + len(os.listdir(self.tmp)) + 10
+        os.utime(os.path.dirname(path), (stamp, stamp))
+        return path
+
+    def test_index(self):
+        fonts = text.load_font_index(self.roots, self.index)
+        self.assertEqual(sorted(fonts), ['Bar', 'Foo'])
+        self.assertTrue(os.path.exists(self.index))
+        # a valid index is used as is
+        fake = os.path.join(self.tmp, 'fake.ttf')
+        with open(self.index) as fp:
+            data = fp.read()
+        with open(self.index, 'w') as fp:
+            fp.write(data.replace(fonts['Foo'], fake))
+        self.assertEqual(text.load_font_index(self.roots, self.index)['Foo'],
+                         fake)
+        # adding a font to a subdirectory invalidates it
+        baz = self.touch('a/sub/Baz.ttf')
+        fonts = text.load_font_index(self.roots, self.index)
+        self.assertEqual(fonts['Baz'], baz)
+        self.assertNotEqual(fonts['Foo'], fake)
+        # so does creating a missing root, and later roots win
+        foo = self.touch('b/Foo.ttf')
+        self.assertEqual(text.load_font_index(self.roots, self.index)['Foo'],
+                         foo)
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_faces(self):
+        bold = text.resolve_font('NotoSans-Bold')
+        emoji = text.resolve_font('NotoEmoji-Regular')
+        junk = self.touch('a/Junk.ttf')
+        index = os.path.join(self.tmp, 'faces.json')
+        faces = text.load_font_faces([bold, emoji, junk], index)
+        self.assertEqual(faces, {bold: ('Noto Sans', 'Bold', 700),
+                                 emoji: ('Noto Emoji', 'Regular', 400)})
+        read = text.read_font_names
+        text.read_font_names = None
+        try:
+            self.assertEqual(
+                text.load_font_faces([bold, emoji, junk], index), faces)
+        finally:
+            text.read_font_names = read
+
+    @unittest.skipUnless(PIL, "requires PIL")
+    def test_find_font(self):
+        bold = text.resolve_font('NotoSans-Bold')
+        emoji = text.resolve_font('NotoEmoji-Regular')
+        self.assertEqual(text.resolve_font('Noto Sans:bold'), bold)
+        self.assertEqual(text.find_font('noto emoji'), emoji)
+        self.assertEqual(text.find_font('Noto Emoji:700'), emoji)
+        self.assertRaises(text.FontNotFound, text.find_font, 'Nope:bold')
+        self.assertEqual(text._parse_style('Semi Bold Italic'),
+                         (600, True, ''))
+        self.assertEqual(text._parse_style('Condensed Light'),
+                         (300, False, 'condensed'))
+
+    def test_memoize(self):
+        calls = []
+
+        @utils.memoize
+        def double(n):
+            calls.append(n)
+            return n * 2
+        self.assertEqual((double(2), double(2), double(3)), (4, 4, 6))
+        self.assertEqual(calls, [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 The Fabulous Authors. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import unittest
+
+from fabulous import pixmap, viewer
+
+
+class Screen(object):
+    """Just enough of a terminal to check what the viewer draws"""
+
+    def __init__(self, width, height):
+        (self.width, self.height) = (width, height)
+        self.cells = [[None] * width for _ in range(height)]
+        (self.row, self.col, self.bg) = (0, 0, None)
+        self.region = (0, height)
+        self.drawn = 0
+
+    def blank(self):
+        return [None] * self.width
+
+    def feed(self, data):
+        for m in re.finditer(r'\x1b\[([0-9;?]*)([A-Za-z@])|(.)', data):
+            (args, cmd, char) = m.groups()
+            if char is not None:
+                self.cells[self.row][self.col] = self.bg
+                self.col += 1
+                self.drawn += 1
+                continue
+            nums = [int(n) for n in args.split(';') if n.isdigit()]
+            n = nums[0] if nums else 1
+            line = self.cells[self.row]
+            (top, bottom) = self.region
+            if cmd == 'H':
+                (self.row, self.col) = (nums[0] - 1, nums[1] - 1)
+            elif cmd == 'K':
+                line[self.col:] = [self.bg] * (self.width - self.col)
+            elif cmd == 'P':
+                del line[self.col:self.col + n]
+                line.extend([None] * n)
+            elif cmd == '@':
+                line[self.col:self.col] = [None] * n
+                del line[self.width:]
+            elif cmd == 'S':
+                region = self.cells[top:bottom]
+                self.cells[top:bottom] = region[n:] + [
+                    self.blank() for _ in range(n)]
+            elif cmd == 'T':
+                region = self.cells[top:bottom]
+                self.cells[top:bottom] = [
+                    self.blank() for _ in range(n)] + region[:-n]
+            elif cmd == 'r':
+                self.region = (nums[0] - 1, nums[1]) if nums else (
+                    0, self.height)
+                (self.row, self.col) = (0, 0)
+            elif cmd == 'm':
+                if nums[:2] == [48, 5]:
+                    self.bg = nums[2]
+                elif not nums or nums[0] in (0, 49):
+                    self.bg = None
+
+
+class TestViewer(unittest.TestCase):
+
+    def setUp(self):
+        (width, height) = (300, 200)
+        data = bytearray()
+        for y in range(height):
+            for x in range(width):
+                data.extend((x * 37 % 256, y * 11 % 256, x * y % 256, 255))
+        self.bmp = pixmap.Bitmap((width, height), data)
+
+    def test_fit(self):
+        view = viewer.Viewer(self.bmp, size=(40, 12))
+        self.assertEqual(view.zoom, 4)
+        self.assertEqual(view.canvas_size(), (19, 7))
+        self.assertEqual(view.pyramid.level(4).size, (18, 12))
+        self.assertEqual(len(view.pyramid.levels), 5)
+
+    def test_tile_cache(self):
+        view = viewer.Viewer(self.bmp, size=(40, 12), cache=4)
+        view.zoom_to(0)
+        misses = view.misses
+        hits = view.hits
+        view.draw()
+        self.assertEqual(view.misses, misses)
+        self.assertTrue(view.hits > hits)
+        view.pan(-300, 0)
+        self.assertTrue(view.misses > misses)
+        self.assertEqual(len(view.tiles), 4)
+        self.assertTrue(all(key[0] == 0 for key in view.tiles))
+
+    def test_pan(self):
+        view = viewer.Viewer(self.bmp, size=(40, 12))
+        screen = Screen(40, 13)
+        screen.feed(view.zoom_to(0))
+        screen.feed(view.pan(-130, -20))
+        self.assertEqual((view.x, view.y), (130, 68))
+        for (dx, dy) in [(5, 0), (0, 3), (-2, 0), (0, -1), (7, 2),
+                         (-3, -4), (100, 0), (0, 100)]:
+            screen.drawn = 0
+            screen.feed(view.pan(dx, dy))
+            fresh = Screen(40, 13)
+            fresh.feed(view.draw())
+            self.assertEqual(screen.cells[:12], fresh.cells[:12])
+            if max(abs(dx), abs(dy) * 4) < 12:
+                # the status bar is 40 columns
+                exposed = abs(dx) * (12 - abs(dy)) + abs(dy) * 40 + 40
+                self.assertTrue(screen.drawn <= exposed)
+
+    def test_zoom_keeps_center(self):
+        view = viewer.Viewer(self.bmp, size=(40, 12))
+        view.zoom_to(0)
+        view.pan(100, 40)
+        (x, y) = (view.x, view.y)
+        view.zoom_to(-1)
+        self.assertEqual((view.x, view.y), (x * 2 + 20, y * 2 + 6))
+        view.zoom_to(0)
+        self.assertEqual((view.x, view.y), (x, y))
+
+    def test_crop(self):
+        view = viewer.Viewer(self.bmp, size=(40, 12))
+        view.zoom_to(0)
+        lines = view.crop()
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(sum(view._row(0)[1::2]), 40)
+
+    def test_keys(self):
+        self.assertEqual(list(viewer._keys(b'jj\x1b[A+q')),
+                         [b'j', b'j', b'\x1b[A', b'+', b'q'])
+
+
+if __name__ == '__main__':
+    unittest.main()